@@ -1,16 +1,618 @@
+import asyncio
+import codecs
+import functools
+import hashlib
+import os
+import posixpath
+import re
+import shlex
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
 import paramiko
 
-def execute_remote_command(hostname=None, port=22 , username=None , password=None , command=None):
+from metrics import observe_ssh_phase, ssh_errors
+
+SSH_PORT = int(os.getenv("SSH_PORT", "22"))
+SSH_CONNECT_TIMEOUT = float(os.getenv("SSH_CONNECT_TIMEOUT", "10"))
+SSH_KEEPALIVE_INTERVAL = int(os.getenv("SSH_KEEPALIVE_INTERVAL", "30"))
+SSH_POOL_MAX_PER_HOST = int(os.getenv("SSH_POOL_MAX_PER_HOST", "4"))
+SSH_POOL_IDLE_TIMEOUT = float(os.getenv("SSH_POOL_IDLE_TIMEOUT", "300"))
+SSH_POOL_HEALTHCHECK_AFTER = float(os.getenv("SSH_POOL_HEALTHCHECK_AFTER", "60"))
+SSH_POOL_ACQUIRE_TIMEOUT = float(os.getenv("SSH_POOL_ACQUIRE_TIMEOUT", "30"))
+SSH_READ_CHUNK = 32768
+SSH_POLL_INTERVAL = 0.05
+# Scripts are stored on targets as <SCRIPT_REMOTE_DIR>/<sha256><ext>; a
+# relative path is under the login user's home directory
+SCRIPT_REMOTE_DIR = os.getenv("SCRIPT_REMOTE_DIR", ".linistrate/scripts")
+SCRIPT_EXTENSION = re.compile(r"[A-Za-z0-9]{1,10}")
+SCRIPT_INTERPRETERS = {".sh": "sh", ".bash": "bash", ".py": "python3", ".pl": "perl", ".rb": "ruby"}
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class CommandTimeout(Exception):
+    pass
+
+
+class PooledConnection:
+    def __init__(self, key, client):
+        self.key = key
+        self.client = client
+        self.last_used = time.monotonic()
+        self.broken = False
+
+    @property
+    def transport(self):
+        return self.client.get_transport()
+
+    def is_alive(self):
+        transport = self.transport
+        return transport is not None and transport.is_active() and transport.is_authenticated()
+
+    def close(self):
+        try:
+            self.client.close()
+        except Exception:
+            pass
+
+
+def _pool_key(hostname, port, username, password):
+    # The credential is part of the key, so once an asset's password changes
+    # its connections authenticated with the old one are never handed out
+    # again and age out with the idle timeout
+    return hostname, port, username, hashlib.sha256((password or "").encode()).hexdigest()
+
+
+class SSHConnectionPool:
+    # Keeps authenticated transports per (ip, port, username, credential) so a
+    # command only pays for opening a channel, not for TCP + key exchange + auth.
+    def __init__(self, max_per_host=SSH_POOL_MAX_PER_HOST, idle_timeout=SSH_POOL_IDLE_TIMEOUT,
+                 keepalive_interval=SSH_KEEPALIVE_INTERVAL, healthcheck_after=SSH_POOL_HEALTHCHECK_AFTER):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+        self.healthcheck_after = healthcheck_after
+        self._cond = threading.Condition()
+        self._idle = {}    # key -> [PooledConnection], most recently used last
+        self._open = {}    # key -> number of open connections (idle + leased)
+        self._waiters = {}  # key -> deque of (loop, future) of acquire_async() callers
+        self._reaper = None
+        self._closed = False
+
+    def _connect(self, hostname, port, username, password):
+        # The TCP connect is made here so it can be timed apart from the SSH
+        # handshake and authentication that paramiko does on the socket
+        start = time.monotonic()
+        try:
+            sock = socket.create_connection((hostname, port), timeout=SSH_CONNECT_TIMEOUT)
+        except Exception:
+            ssh_errors.inc(host=hostname, phase="connect")
+            raise
+        connected = time.monotonic()
+        observe_ssh_phase(hostname, "connect", connected - start)
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            client.connect(hostname=hostname, port=port, username=username, password=password, sock=sock,
+                           timeout=SSH_CONNECT_TIMEOUT, banner_timeout=SSH_CONNECT_TIMEOUT,
+                           auth_timeout=SSH_CONNECT_TIMEOUT, look_for_keys=False, allow_agent=False)
+        except Exception:
+            client.close()
+            sock.close()
+            ssh_errors.inc(host=hostname, phase="auth")
+            raise
+        observe_ssh_phase(hostname, "auth", time.monotonic() - connected)
+        client.get_transport().set_keepalive(self.keepalive_interval)
+        return client
+
+    def _stale(self, conn):
+        return time.monotonic() - conn.last_used >= self.healthcheck_after
+
+    def _healthy(self, conn):
+        if not conn.is_alive():
+            return False
+        if not self._stale(conn):
+            return True
+        # Idle for a while: make sure the server still answers before handing it out
+        try:
+            conn.transport.open_session(timeout=SSH_CONNECT_TIMEOUT).close()
+            return True
+        except Exception:
+            return False
+
+    def _checkout(self, key):
+        # Returns (idle connection, False), (None, True) when a new slot was
+        # reserved, or (None, False) when the host is at its cap.
+        with self._cond:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), False
+            if self._open.get(key, 0) < self.max_per_host:
+                self._open[key] = self._open.get(key, 0) + 1
+                return None, True
+            return None, False
+
+    def _notify(self, key):
+        # Called with self._cond held whenever a connection or slot of `key`
+        # frees up: wakes one thread in acquire() and one acquire_async()
+        # caller. Releases can happen on any thread, so the future is resolved
+        # on its own loop.
+        self._cond.notify()
+        waiters = self._waiters.get(key)
+        while waiters:
+            loop, waiter = waiters.popleft()
+            try:
+                loop.call_soon_threadsafe(self._wake, key, waiter)
+                break
+            except RuntimeError:
+                continue    # its loop is closed
+        if not waiters:
+            self._waiters.pop(key, None)
+
+    def _wake(self, key, waiter):
+        if waiter.done():
+            # the caller timed out or was cancelled meanwhile; pass the turn on
+            with self._cond:
+                self._notify(key)
+        else:
+            waiter.set_result(None)
+
+    def _unreserve(self, key):
+        with self._cond:
+            self._open[key] -= 1
+            self._notify(key)
+
+    def _abandon(self, key, connect):
+        # A handshake whose caller was cancelled: the thread cannot be
+        # interrupted, so close whatever client it produced and free the slot
+        if not connect.cancelled() and connect.exception() is None:
+            connect.result().close()
+        self._unreserve(key)
+
+    def acquire(self, hostname, port, username, password, timeout=SSH_POOL_ACQUIRE_TIMEOUT):
+        key = _pool_key(hostname, port, username, password)
+        deadline = time.monotonic() + timeout
+        self._start_reaper()
+        while True:
+            with self._cond:
+                conn, reserved = self._checkout(key)
+                if conn is None and not reserved:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolExhausted(f"No free SSH connection to {hostname} after {timeout}s")
+                    self._cond.wait(remaining)
+                    continue
+            if conn is not None:
+                if self._healthy(conn):
+                    return conn
+                self._discard(conn)
+                continue
+            try:
+                return PooledConnection(key, self._connect(hostname, port, username, password))
+            except Exception:
+                self._unreserve(key)
+                raise
+
+    async def acquire_async(self, hostname, port, username, password, timeout=SSH_POOL_ACQUIRE_TIMEOUT):
+        # Same as acquire() but waits for a free slot on the event loop, woken
+        # by _notify(); only the handshake and the occasional stale-connection
+        # probe go to a thread.
+        key = _pool_key(hostname, port, username, password)
+        deadline = time.monotonic() + timeout
+        loop = asyncio.get_running_loop()
+        self._start_reaper()
+        while True:
+            with self._cond:
+                conn, reserved = self._checkout(key)
+                if conn is None and not reserved:
+                    # registered under the same lock as the failed checkout, so
+                    # a release in between cannot be missed
+                    waiter = loop.create_future()
+                    entry = (loop, waiter)
+                    self._waiters.setdefault(key, deque()).append(entry)
+            if conn is None and not reserved:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError()
+                    await asyncio.wait_for(waiter, remaining)
+                except asyncio.TimeoutError:
+                    raise PoolExhausted(f"No free SSH connection to {hostname} after {timeout}s") from None
+                finally:
+                    with self._cond:
+                        waiters = self._waiters.get(key)
+                        if waiters and entry in waiters:
+                            waiters.remove(entry)
+                            if not waiters:
+                                self._waiters.pop(key, None)
+                continue
+            if conn is not None:
+                if self._stale(conn):
+                    healthy = await asyncio.to_thread(self._healthy, conn)
+                else:
+                    healthy = conn.is_alive()
+                if healthy:
+                    return conn
+                self._discard(conn)
+                continue
+            connect = asyncio.ensure_future(asyncio.to_thread(self._connect, hostname, port, username, password))
+            try:
+                return PooledConnection(key, await asyncio.shield(connect))
+            except BaseException:
+                if connect.done():
+                    self._abandon(key, connect)
+                else:
+                    connect.add_done_callback(functools.partial(self._abandon, key))
+                raise
+
+    def release(self, conn):
+        if conn.broken or self._closed or not conn.is_alive():
+            self._discard(conn)
+            return
+        conn.last_used = time.monotonic()
+        with self._cond:
+            self._idle.setdefault(conn.key, []).append(conn)
+            self._notify(conn.key)
+
+    def _discard(self, conn):
+        conn.close()
+        with self._cond:
+            self._open[conn.key] = max(self._open.get(conn.key, 1) - 1, 0)
+            if not self._open[conn.key]:
+                self._open.pop(conn.key, None)
+            self._notify(conn.key)
+
+    @contextmanager
+    def connection(self, hostname, port, username, password):
+        conn = self.acquire(hostname, port, username, password)
+        try:
+            yield conn
+        except Exception:
+            conn.broken = not conn.is_alive()
+            raise
+        finally:
+            self.release(conn)
+
+    @asynccontextmanager
+    async def connection_async(self, hostname, port, username, password):
+        conn = await self.acquire_async(hostname, port, username, password)
+        try:
+            yield conn
+        except BaseException:
+            conn.broken = not conn.is_alive()
+            raise
+        finally:
+            self.release(conn)
+
+    def evict_idle(self):
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            for key, idle in list(self._idle.items()):
+                keep = []
+                for conn in idle:
+                    if now - conn.last_used > self.idle_timeout or not conn.is_alive():
+                        expired.append(conn)
+                    else:
+                        keep.append(conn)
+                if keep:
+                    self._idle[key] = keep
+                else:
+                    self._idle.pop(key, None)
+        for conn in expired:
+            self._discard(conn)
+
+    def _start_reaper(self):
+        if self._reaper is not None:
+            return
+        with self._cond:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap, name="ssh-pool-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap(self):
+        while not self._closed:
+            time.sleep(max(min(self.idle_timeout / 2, 30), 1))
+            self.evict_idle()
+
+    def stats(self):
+        stats = {}
+        with self._cond:
+            for key in set(self._open) | set(self._idle):
+                host, port, username = key[:3]
+                entry = stats.setdefault(f"{username}@{host}:{port}", {"open": 0, "idle": 0})
+                entry["open"] += self._open.get(key, 0)
+                entry["idle"] += len(self._idle.get(key, []))
+        return stats
+
+    def close_all(self):
+        self._closed = True
+        with self._cond:
+            conns = [conn for idle in self._idle.values() for conn in idle]
+            self._idle.clear()
+        for conn in conns:
+            self._discard(conn)
+
+
+ssh_pool = SSHConnectionPool()
+
+
+def run_on_transport(transport, command, timeout=None):
+    channel = transport.open_session(timeout=SSH_CONNECT_TIMEOUT)
     try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(hostname=hostname , port=port , username=username , password=password)
-        stdin , stdout , stderror = ssh.exec_command(command)
-        output= stdout.read().decode()
+        channel.settimeout(timeout)
+        channel.exec_command(command)
+        stdout = channel.makefile("rb")
+        stderror = channel.makefile_stderr("rb")
+        output = stdout.read().decode()
         error = stderror.read().decode()
-        ssh.close()
+        channel.recv_exit_status()
+    except socket.timeout:
+        raise CommandTimeout()
+    finally:
+        channel.close()
+    return {"output": output.strip(), "error": error.strip()}
+
+
+def execute_remote_command(hostname=None, port=SSH_PORT , username=None , password=None , command=None, timeout=None):
+    try:
+        with ssh_pool.connection(hostname, port, username, password) as conn:
+            return run_on_transport(conn.transport, command, timeout=timeout)
+
+    except CommandTimeout:
+        return {"output": "", "error": f"Command timed out after {timeout}s", "timed_out": True}
+    except Exception as e:
+        return {"output": "", "error": str(e)}
+
+
+
+async def _wait_readable(channel, timeout):
+    # paramiko exposes a pollable fd that turns readable when stdout/stderr
+    # data or EOF arrives, so the loop can wait on it without a thread.
+    loop = asyncio.get_running_loop()
+    ready = loop.create_future()
+    fd = channel.fileno()
+    try:
+        loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+    except NotImplementedError:
+        # Proactor loop on Windows has no add_reader; fall back to polling
+        await asyncio.sleep(SSH_POLL_INTERVAL if timeout is None else min(SSH_POLL_INTERVAL, timeout))
+        return
+    try:
+        await asyncio.wait_for(ready, timeout)
+    finally:
+        loop.remove_reader(fd)
+
+
+async def iter_channel(channel, timeout=None):
+    # Yields ("stdout" | "stderr", bytes) chunks until the remote side closes
+    deadline = None if timeout is None else time.monotonic() + timeout
+    channel.setblocking(0)
+    while True:
+        got = False
+        if channel.recv_ready():
+            yield "stdout", channel.recv(SSH_READ_CHUNK)
+            got = True
+        if channel.recv_stderr_ready():
+            yield "stderr", channel.recv_stderr(SSH_READ_CHUNK)
+            got = True
+        if got:
+            continue
+        if channel.eof_received or channel.closed:
+            break
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            raise CommandTimeout()
+        try:
+            await _wait_readable(channel, remaining)
+        except asyncio.TimeoutError:
+            raise CommandTimeout()
+
+
+def _open_exec_channel(transport, command):
+    channel = transport.open_session(timeout=SSH_CONNECT_TIMEOUT)
+    channel.exec_command(command)
+    return channel
+
+
+async def _start_command(conn, command):
+    host = conn.key[0]
+    start = time.monotonic()
+    try:
+        channel = await asyncio.to_thread(_open_exec_channel, conn.transport, command)
+    except Exception:
+        ssh_errors.inc(host=host, phase="exec")
+        raise
+    observe_ssh_phase(host, "exec", time.monotonic() - start)
+    return channel
+
+
+@contextmanager
+def _timed_read(host):
+    start = time.monotonic()
+    try:
+        yield
+    except CommandTimeout:
+        ssh_errors.inc(host=host, phase="read")
+        raise
+    finally:
+        observe_ssh_phase(host, "read", time.monotonic() - start)
+
+
+async def stream_remote_command(hostname=None, port=SSH_PORT, username=None, password=None, command=None, timeout=None, timings=None):
+    # Yields ("stdout" | "stderr", text) as output arrives. The channel is only
+    # read when the consumer asks for the next chunk, so a slow consumer stops
+    # paramiko from re-opening the SSH window and the remote side blocks.
+    # `timings`, when given, receives connect_ms (pool checkout, including any
+    # handshake) and exec_ms (channel open until the remote side is done).
+    start = time.monotonic()
+    async with ssh_pool.connection_async(hostname, port, username, password) as conn:
+        connected = time.monotonic()
+        if timings is not None:
+            timings["connect_ms"] = round((connected - start) * 1000, 2)
+        channel = await _start_command(conn, command)
+        decoders = {"stdout": codecs.getincrementaldecoder("utf-8")(errors="replace"),
+                    "stderr": codecs.getincrementaldecoder("utf-8")(errors="replace")}
+        try:
+            with _timed_read(hostname):
+                async for stream, data in iter_channel(channel, timeout):
+                    text = decoders[stream].decode(data)
+                    if text:
+                        yield stream, text
+            for stream, decoder in decoders.items():
+                text = decoder.decode(b"", final=True)
+                if text:
+                    yield stream, text
+        finally:
+            channel.close()
+            if timings is not None:
+                timings["exec_ms"] = round((time.monotonic() - connected) * 1000, 2)
+
+
+async def execute_remote_command_async(hostname=None, port=SSH_PORT, username=None, password=None, command=None, timeout=None):
+    timings = {}
+    try:
+        output, error = [], []
+        async for stream, text in stream_remote_command(hostname, port, username, password, command, timeout, timings):
+            (output if stream == "stdout" else error).append(text)
+        return {"output": "".join(output).strip(), "error": "".join(error).strip(), **timings}
 
-        return {"output":output.strip() , "error":error.strip()}
-    
+    except CommandTimeout:
+        return {"output": "", "error": f"Command timed out after {timeout}s", "timed_out": True, **timings}
+    except Exception as e:
+        return {"output": "", "error": str(e), **timings}
+
+
+
+async def _collect_channel(conn, command, timeout, connect_ms):
+    start = time.monotonic()
+    channel = await _start_command(conn, command)
+    output, error = [], []
+    try:
+        with _timed_read(conn.key[0]):
+            async for stream, data in iter_channel(channel, timeout):
+                (output if stream == "stdout" else error).append(data)
+    finally:
+        channel.close()
+    return {"output": b"".join(output).decode(errors="replace").strip(),
+            "error": b"".join(error).decode(errors="replace").strip(),
+            "connect_ms": connect_ms, "exec_ms": round((time.monotonic() - start) * 1000, 2)}
+
+
+async def execute_remote_batch_async(hostname=None, port=SSH_PORT, username=None, password=None, commands=()):
+    # Runs several (command, timeout) pairs over one pooled SSH connection,
+    # each on its own channel, and returns one result per pair in order
+    # Every result carries the shared connect_ms and its own exec_ms
+    start = time.monotonic()
+    connect_ms = None
+    try:
+        async with ssh_pool.connection_async(hostname, port, username, password) as conn:
+            connected = time.monotonic()
+            connect_ms = round((connected - start) * 1000, 2)
+            outcomes = await asyncio.gather(*(_collect_channel(conn, command, timeout, connect_ms) for command, timeout in commands),
+                                            return_exceptions=True)
+            if any(isinstance(outcome, Exception) for outcome in outcomes):
+                conn.broken = not conn.is_alive()
+    except Exception as e:
+        return [{"output": "", "error": str(e), "connect_ms": connect_ms} for _ in commands]
+    exec_ms = round((time.monotonic() - connected) * 1000, 2)
+    results = []
+    for (command, timeout), outcome in zip(commands, outcomes):
+        if isinstance(outcome, CommandTimeout):
+            results.append({"output": "", "error": f"Command timed out after {timeout}s", "timed_out": True,
+                            "connect_ms": connect_ms, "exec_ms": exec_ms})
+        elif isinstance(outcome, BaseException):
+            results.append({"output": "", "error": str(outcome), "connect_ms": connect_ms, "exec_ms": exec_ms})
+        else:
+            results.append(outcome)
+    return results
+
+
+def script_digest(source):
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def script_remote_path(digest, extension):
+    extension = (extension or "").lstrip(".")
+    if extension and not SCRIPT_EXTENSION.fullmatch(extension):
+        # the extension is part of a remote path, so nothing that could leave SCRIPT_REMOTE_DIR
+        raise ValueError(f"Invalid script extension '{extension}'")
+    return posixpath.join(SCRIPT_REMOTE_DIR, digest + (f".{extension}" if extension else ""))
+
+
+def script_command(path, extension):
+    interpreter = SCRIPT_INTERPRETERS.get(f".{(extension or '').lstrip('.').lower()}")
+    if interpreter:
+        return f"{interpreter} {shlex.quote(path)}"
+    return shlex.quote(path if posixpath.isabs(path) or path.startswith(".") else f"./{path}")
+
+
+def _ensure_script(transport, path, data):
+    # Uploads `data` to `path` unless a file is already there; the name is the
+    # content hash, so an existing file is the same script. Writes go to a
+    # temporary name first so a concurrent run never executes a partial file.
+    # Returns True when the file was uploaded.
+    sftp = paramiko.SFTPClient.from_transport(transport)
+    try:
+        try:
+            sftp.stat(path)
+            return False
+        except FileNotFoundError:
+            pass
+        directory = ""
+        for part in posixpath.dirname(path).split("/"):
+            directory = posixpath.join(directory, part) if directory or part else "/"
+            try:
+                sftp.stat(directory)
+            except FileNotFoundError:
+                sftp.mkdir(directory, 0o700)
+        partial = f"{path}.{uuid.uuid4().hex}.part"
+        with sftp.open(partial, "wb") as f:
+            f.write(data)
+        sftp.chmod(partial, 0o700)
+        try:
+            sftp.posix_rename(partial, path)
+        except IOError:
+            # no posix-rename extension; plain rename fails if another run
+            # finished first, which leaves an identical file in place
+            try:
+                sftp.rename(partial, path)
+            except IOError:
+                sftp.remove(partial)
+        return True
+    finally:
+        sftp.close()
+
+
+async def execute_remote_script_async(hostname=None, port=SSH_PORT, username=None, password=None, source=None,
+                                      extension=None, timeout=None):
+    # Runs a stored script: SFTP-uploads it to its content-hash path if the
+    # target does not have it yet, then executes it on a second channel of the
+    # same pooled connection. Results look like execute_remote_command_async
+    # plus "path" and "uploaded"; upload time is part of exec_ms.
+    digest = script_digest(source)
+    path = script_remote_path(digest, extension)
+    command = script_command(path, extension)
+    timings = {"connect_ms": None}
+    start = time.monotonic()
+    try:
+        async with ssh_pool.connection_async(hostname, port, username, password) as conn:
+            connected = time.monotonic()
+            timings["connect_ms"] = round((connected - start) * 1000, 2)
+            uploaded = await asyncio.to_thread(_ensure_script, conn.transport, path, source.encode())
+            result = await _collect_channel(conn, command, timeout, timings["connect_ms"])
+            result["exec_ms"] = round((time.monotonic() - connected) * 1000, 2)
+            return {**result, "command": command, "path": path, "uploaded": uploaded}
+    except CommandTimeout:
+        return {"output": "", "error": f"Command timed out after {timeout}s", "timed_out": True,
+                "command": command, "path": path, **timings}
     except Exception as e:
-        return {"output": "", "error": str(e)}
\ No newline at end of file
+        return {"output": "", "error": str(e) or e.__class__.__name__, "command": command, "path": path, **timings}
@@ -0,0 +1,93 @@
+import codecs
+import csv
+import io
+import json
+import os
+
+# Incremental parsing for bulk asset import and formatting for export. Input
+# arrives as raw body chunks; nothing holds more than one record plus one
+# chunk of text at a time.
+IMPORT_MAX_RECORD_CHARS = int(os.getenv("IMPORT_MAX_RECORD_CHARS", str(64 * 1024)))
+ASSET_EXPORT_FIELDS = ("asset_id", "name", "ip", "technology", "username", "group", "group_color", "is_active", "created_at")
+
+
+class ImportFormatError(Exception):
+    pass
+
+
+async def iter_lines(chunks):
+    # A leading BOM (spreadsheet exports) is dropped by utf-8-sig
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+        if len(pending) > IMPORT_MAX_RECORD_CHARS:
+            raise ImportFormatError(f"Line longer than {IMPORT_MAX_RECORD_CHARS} characters")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_csv_records(lines):
+    # Yields (row_number, record, error). The first record is the header;
+    # quoted fields may span lines, so lines are joined until quotes balance.
+    header = None
+    buffered = None
+    row_number = 0
+    async for line in lines:
+        buffered = line if buffered is None else f"{buffered}\n{line}"
+        if buffered.count('"') % 2:
+            if len(buffered) > IMPORT_MAX_RECORD_CHARS:
+                raise ImportFormatError(f"Record longer than {IMPORT_MAX_RECORD_CHARS} characters")
+            continue
+        text, buffered = buffered, None
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [value.strip().lower() for value in values]
+            continue
+        row_number += 1
+        if len(values) != len(header):
+            yield row_number, None, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        yield row_number, dict(zip(header, values)), None
+    if buffered is not None:
+        yield row_number + 1, None, "Unterminated quoted field"
+
+
+async def iter_ndjson_records(lines):
+    row_number = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield row_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield row_number, None, "Expected a JSON object"
+            continue
+        yield row_number, {key: "" if value is None else str(value) for key, value in record.items()}, None
+
+
+def iter_records(chunks, fmt):
+    lines = iter_lines(chunks)
+    return iter_csv_records(lines) if fmt == "csv" else iter_ndjson_records(lines)
+
+
+def format_rows(rows, fmt, header=False):
+    if fmt == "ndjson":
+        return "".join(json.dumps(dict(row), default=str) + "\n" for row in rows)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(ASSET_EXPORT_FIELDS)
+    for row in rows:
+        writer.writerow([row[field] for field in ASSET_EXPORT_FIELDS])
+    return buffer.getvalue()
@@ -1,20 +1,74 @@
 # auth.py
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.openapi.utils import get_openapi
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database_async import get_db
+from models import User
+from cache import TTLCache
 from utils import verify_token
+import os
+import secrets
+import time
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/user/v1/loginuser")
 
-def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+
+# Operator endpoints expose data of every user. They need an account listed in
+# ADMIN_USERS ("alice,bob", by username) or the ADMIN_TOKEN in X-Admin-Token.
+ADMIN_USERS = {name.strip() for name in os.getenv("ADMIN_USERS", "").split(",") if name.strip()}
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# validated token -> resolved user, so most requests skip both the JWT decode
+# and the users lookup. Entries are dropped by invalidate_user() on writes.
+_user_cache = TTLCache(ttl=USER_CACHE_TTL, maxsize=10000)
+
+def _unauthorized():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid or expired token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> dict:
+    # FastAPI caches dependencies per request, so this runs once per request
+    # no matter how many dependencies ask for the current user
+    current_user = _user_cache.get(token)
+    if current_user is not None:
+        return current_user
+
     payload = verify_token(token)
     if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    return payload
+        raise _unauthorized()
+    existing_user = (await db.execute(select(User).filter(User.user_id == payload.get("user_id")))).scalars().first()
+    if not existing_user or not existing_user.is_active:
+        raise _unauthorized()
+
+    current_user = {"sub": existing_user.username, "user_id": existing_user.user_id, "email": existing_user.email}
+    ttl = min(USER_CACHE_TTL, payload["exp"] - time.time())
+    if ttl > 0:
+        _user_cache.set(token, current_user, ttl=ttl)
+    return current_user
+
+def is_admin(current_user: dict) -> bool:
+    return current_user["sub"] in ADMIN_USERS
+
+def require_admin(header: str = "x-admin-token", token: str | None = ADMIN_TOKEN):
+    # Dependency factory; `header`/`token` let an endpoint accept its own
+    # secret in place of ADMIN_TOKEN. An unset token never matches.
+    async def check(request: Request, current_user: dict = Depends(get_current_user)) -> dict:
+        sent = request.headers.get(header)
+        if token and sent and secrets.compare_digest(sent, token):
+            return current_user
+        if is_admin(current_user):
+            return current_user
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return check
+
+def invalidate_user(user_id: int):
+    _user_cache.discard_where(lambda cached: cached["user_id"] == user_id)
 
 def custom_openapi(app):
     if app.openapi_schema:
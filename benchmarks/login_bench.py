@@ -0,0 +1,54 @@
+# Measures /user/v1/loginuser latency under concurrent load against a running
+# server. Needs httpx (pip install httpx).
+#
+#   python benchmarks/login_bench.py --url http://localhost:8000 \
+#       --identifier alice --password secret --requests 500 --concurrency 50
+import argparse
+import asyncio
+import statistics
+from time import perf_counter
+
+import httpx
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * p), len(ordered) - 1)]
+
+
+async def run(url, identifier, password, total, concurrency):
+    latencies, statuses = [], {}
+    limit = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+        async def login():
+            async with limit:
+                start = perf_counter()
+                res = await client.post("/user/v1/loginuser", json={"identifier": identifier, "password": password})
+                latencies.append(perf_counter() - start)
+                statuses[res.status_code] = statuses.get(res.status_code, 0) + 1
+
+        start = perf_counter()
+        await asyncio.gather(*(login() for _ in range(total)))
+        elapsed = perf_counter() - start
+
+    print(f"requests={total} concurrency={concurrency} elapsed={elapsed:.2f}s rps={total / elapsed:.1f}")
+    print(f"status codes: {statuses}")
+    print("latency ms: mean={:.1f} p50={:.1f} p95={:.1f} p99={:.1f} max={:.1f}".format(
+        statistics.mean(latencies) * 1000,
+        percentile(latencies, 0.50) * 1000,
+        percentile(latencies, 0.95) * 1000,
+        percentile(latencies, 0.99) * 1000,
+        max(latencies) * 1000,
+    ))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--identifier", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.identifier, args.password, args.requests, args.concurrency))
@@ -0,0 +1,233 @@
+# Load-test suite for the API. Starts the app from main.py with uvicorn against
+# a throwaway database (SQLite by default, or any DATABASE_URL you pass) and an
+# in-process SSH fleet from ssh_server.py, then drives login, get-assets,
+# executions and command-request at fixed concurrency levels.
+#
+#   pip install -r benchmarks/requirements.txt
+#   python benchmarks/run.py --hosts 20 --concurrency 1,10,50 --requests 300
+#   python benchmarks/run.py --compare benchmarks/results/<earlier run>.json
+#
+# benchmarks/results/20261017_135606_589fd1b.json is the reference run of the
+# suite as first added (default settings, SQLite, one CPU); compare against it
+# on similar hardware only.
+#
+# Emulated hosts bind 127.0.0.2 and up; Linux routes all of 127.0.0.0/8 to
+# loopback, other systems may need the aliases added first.
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from time import perf_counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+SCENARIOS = ["login", "get-assets", "executions", "command-request"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", default=f"sqlite+aiosqlite:///{os.path.join(ROOT, 'benchmarks', 'bench.db')}")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ssh-port", type=int, default=2222)
+    parser.add_argument("--hosts", type=int, default=10)
+    parser.add_argument("--ssh-latency", type=float, default=0.05, help="seconds per remote command")
+    parser.add_argument("--ssh-jitter", type=float, default=0.01)
+    parser.add_argument("--output-size", type=int, default=1024, help="bytes of output per remote command")
+    parser.add_argument("--history-rows", type=int, default=1000, help="command_request rows seeded before the run")
+    parser.add_argument("--concurrency", default="1,10,50")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario and concurrency level")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    parser.add_argument("--no-save", action="store_true")
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    # Must run before anything imports the app: settings are read at import
+    from cryptography.fernet import Fernet
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("FERNET_KEY", Fernet.generate_key().decode())
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+    os.environ["SSH_PORT"] = str(args.ssh_port)
+    os.environ["DB_SSL"] = "disable"
+    sys.path.insert(0, ROOT)
+
+
+CREDENTIALS = {"username": "bench", "password": "bench-password", "email": "bench@example.com"}
+
+
+async def prepare_database(addresses, history_rows):
+    from database import Base
+    from database_async import engine, AsyncSessionLocal
+    from models import Asset, CommandRequest, Group, Technology, User
+    from utils import encrypt_data, hash_password
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as session:
+        user = User(username=CREDENTIALS["username"], email=CREDENTIALS["email"],
+                    password=hash_password(CREDENTIALS["password"]))
+        technology = Technology(name="Linux")
+        session.add_all([user, technology])
+        await session.flush()
+        group = Group(name="bench", owner_id=user.user_id)
+        session.add(group)
+        await session.flush()
+        assets = [Asset(name=f"bench-{i}", ip=address, technology=technology.technology_id, username="bench",
+                        password=encrypt_data("bench"), owner_id=user.user_id, group_id=group.group_id)
+                  for i, address in enumerate(addresses)]
+        session.add_all(assets)
+        await session.flush()
+        session.add_all([
+            CommandRequest(command="uptime", status="success", output="up 1 day", error="", duration="0.05s", duration_ms=50.0,
+                           asset_id=assets[i % len(assets)].asset_id, owner_id=user.user_id)
+            for i in range(history_rows)
+        ])
+        await session.commit()
+    # The server runs its own event loop; pooled connections must not leak into it
+    await engine.dispose()
+
+
+def start_server(port):
+    import uvicorn
+    from main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * p), len(ordered) - 1)]
+
+
+async def drive(client, make_request, total, concurrency):
+    latencies, errors = [], 0
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        nonlocal errors
+        async with limit:
+            start = perf_counter()
+            try:
+                res = await make_request(i)
+                if res.status_code >= 400:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(perf_counter() - start)
+
+    start = perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = perf_counter() - start
+    return {
+        "requests": total,
+        "errors": errors,
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+async def run_suite(args, addresses):
+    import httpx
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    scenarios = args.scenarios.split(",")
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=120, limits=limits) as client:
+        res = await client.post("/user/v1/loginuser", json={
+            "identifier": CREDENTIALS["username"], "password": CREDENTIALS["password"]})
+        res.raise_for_status()
+        headers = {"Authorization": f"Bearer {res.json()['token']}"}
+        # warm the SSH pool so the first level does not pay every handshake
+        await asyncio.gather(*(client.post("/command/v1/command-request", headers=headers,
+                                           json={"command": "true", "ip": address}) for address in addresses))
+
+        requests = {
+            "login": lambda i: client.post("/user/v1/loginuser", json={
+                "identifier": CREDENTIALS["username"], "password": CREDENTIALS["password"]}),
+            "get-assets": lambda i: client.get("/asset/v1/get-assets", headers=headers),
+            "executions": lambda i: client.get("/command/v1/executions", headers=headers),
+            "command-request": lambda i: client.post("/command/v1/command-request", headers=headers, json={
+                "command": "uptime", "ip": addresses[i % len(addresses)]}),
+        }
+
+        results = {}
+        for name in scenarios:
+            results[name] = {}
+            for level in levels:
+                results[name][str(level)] = await drive(client, requests[name], args.requests, level)
+                print(f"{name:<16} c={level:<4} {results[name][str(level)]}")
+        return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["scenarios"]
+    print(f"\nchange vs {baseline_path} (negative latency / positive rps is better)")
+    for name, levels in current.items():
+        for level, result in levels.items():
+            before = baseline.get(name, {}).get(level)
+            if not before:
+                continue
+            deltas = []
+            for key in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+                if before[key]:
+                    deltas.append(f"{key} {100 * (result[key] - before[key]) / before[key]:+.1f}%")
+            print(f"{name:<16} c={level:<4} " + "  ".join(deltas))
+
+
+def main():
+    args = parse_args()
+    configure_environment(args)
+
+    from ssh_server import SSHFleet
+    fleet = SSHFleet(args.hosts, port=args.ssh_port, latency=args.ssh_latency,
+                     jitter=args.ssh_jitter, output_size=args.output_size).start()
+    asyncio.run(prepare_database(fleet.addresses, args.history_rows))
+    server, thread = start_server(args.port)
+    try:
+        results = asyncio.run(run_suite(args, fleet.addresses))
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+        fleet.stop()
+
+    report = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "revision": git_revision(),
+        "settings": vars(args),
+        "scenarios": results,
+    }
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{datetime.utcnow():%Y%m%d_%H%M%S}_{report['revision'] or 'local'}.json")
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nsaved {path}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# In-process SSH stand-in for benchmarks. Each emulated host listens on its
+# own loopback address (127.0.0.2, 127.0.0.3, ...) on the same port, accepts
+# any password and answers every exec request after a configurable delay with
+# a fixed amount of output.
+import random
+import socket
+import threading
+import time
+
+import paramiko
+
+
+class EmulatedHost(paramiko.ServerInterface):
+    def __init__(self, latency, jitter, output_size):
+        self.latency = latency
+        self.jitter = jitter
+        self.output_size = output_size
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self._run, args=(channel, command), daemon=True).start()
+        return True
+
+    def _run(self, channel, command):
+        try:
+            time.sleep(max(self.latency + random.uniform(-self.jitter, self.jitter), 0))
+            line = f"{command.decode(errors='replace')}: ok\n".encode()
+            remaining = self.output_size
+            while remaining > 0:
+                chunk = (line * (32768 // len(line) + 1))[:min(remaining, 32768)]
+                channel.sendall(chunk)
+                remaining -= len(chunk)
+            channel.send_exit_status(0)
+        except Exception:
+            pass
+        finally:
+            channel.close()
+
+
+class SSHFleet:
+    def __init__(self, hosts, port=2222, latency=0.05, jitter=0.01, output_size=1024):
+        self.addresses = [f"127.0.0.{i + 2}" for i in range(hosts)]
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.output_size = output_size
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self._sockets = []
+        self._stopped = threading.Event()
+
+    def start(self):
+        for address in self.addresses:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((address, self.port))
+            sock.listen(128)
+            sock.settimeout(0.5)
+            self._sockets.append(sock)
+            threading.Thread(target=self._accept, args=(sock,), daemon=True).start()
+        return self
+
+    def _accept(self, sock):
+        while not self._stopped.is_set():
+            try:
+                client, _ = sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client):
+        transport = paramiko.Transport(client)
+        transport.add_server_key(self.host_key)
+        try:
+            transport.start_server(server=EmulatedHost(self.latency, self.jitter, self.output_size))
+        except Exception:
+            transport.close()
+            return
+        # Keep the transport open so the app's pool can reuse it. paramiko only
+        # holds weak references to channels, so accepted ones are kept here
+        # until they close.
+        channels = set()
+        while transport.is_active() and not self._stopped.is_set():
+            channel = transport.accept(0.5)
+            if channel is not None:
+                channels.add(channel)
+            channels = {channel for channel in channels if not channel.closed}
+
+    def stop(self):
+        self._stopped.set()
+        for sock in self._sockets:
+            sock.close()
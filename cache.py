@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    # Small thread-safe in-process cache. Entries expire after `ttl` seconds and
+    # the least recently used one is dropped once `maxsize` is reached.
+    def __init__(self, ttl, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            if entry[0] <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def discard_where(self, predicate):
+        with self._lock:
+            for key in [key for key, (_, value) in self._data.items() if predicate(value)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SizedLRUCache:
+    # Thread-safe LRU bounded by the total size of its values rather than the
+    # number of entries; `sizeof` gives the size of one value. A value larger
+    # than the whole budget is not cached.
+    def __init__(self, max_size, sizeof=len):
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        self._data = OrderedDict()   # key -> (size, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= old[0]
+            if size > self.max_size:
+                return
+            self._data[key] = (size, value)
+            self.size += size
+            while self.size > self.max_size:
+                _, (evicted, _) = self._data.popitem(last=False)
+                self.size -= evicted
+
+    def discard_keys(self, predicate):
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                self.size -= self._data.pop(key)[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._data)
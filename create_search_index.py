@@ -0,0 +1,9 @@
+# Adds the command history search indexes to a database created before search
+# existed; new databases get them from create_tables.py
+from database_sync import engine
+from search import create_search_index
+
+print("Creating search index")
+with engine.begin() as conn:
+    create_search_index(conn)
+print("Search index ready")
@@ -1,6 +1,7 @@
 # this is create table , which is being run onlyu once
-from database import Base , engine
-from models import User, Asset , CommandRequest ,Scripts, ScriptsCategory , Group
+from database import Base
+from database_sync import engine
+from models import User, Asset , CommandRequest ,Scripts, ScriptsCategory , Group , ScheduledCommand
 
 print("Creating tables")
 Base.metadata.create_all(bind=engine)
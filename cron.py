@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+# Cron expressions: minute hour day-of-month month day-of-week, evaluated in
+# UTC. Supports *, lists, ranges, steps, month/day names and the @hourly,
+# @daily, @weekly, @monthly and @yearly shorthands.
+CRON_MACROS = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+}
+MONTH_NAMES = {name: i + 1 for i, name in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"])}
+DAY_NAMES = {name: i for i, name in enumerate(["sun", "mon", "tue", "wed", "thu", "fri", "sat"])}
+CRON_SEARCH_YEARS = 5
+
+
+def _parse_field(text, low, high, names=None):
+    def value(token):
+        token = token.lower()
+        if names and token in names:
+            return names[token]
+        return int(token)
+
+    values = set()
+    for part in text.split(","):
+        step = None
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step < 1:
+                raise ValueError(f"invalid step in '{text}'")
+        if part == "*":
+            first, last = low, high
+        elif "-" in part:
+            first, last = (value(token) for token in part.split("-", 1))
+        else:
+            first = value(part)
+            last = high if step else first
+        if not low <= first <= last <= high:
+            raise ValueError(f"'{text}' is outside {low}-{high}")
+        values.update(range(first, last + 1, step or 1))
+    return frozenset(values)
+
+
+class CronExpression:
+    def __init__(self, expression):
+        self.expression = expression.strip()
+        fields = CRON_MACROS.get(self.expression.lower(), self.expression).split()
+        if len(fields) != 5:
+            raise ValueError("cron expression needs 5 fields: minute hour day month weekday")
+        try:
+            self.minutes = _parse_field(fields[0], 0, 59)
+            self.hours = _parse_field(fields[1], 0, 23)
+            self.days = _parse_field(fields[2], 1, 31)
+            self.months = _parse_field(fields[3], 1, 12, MONTH_NAMES)
+            # 7 is accepted as another name for Sunday
+            self.weekdays = frozenset(day % 7 for day in _parse_field(fields[4], 0, 7, DAY_NAMES))
+        except ValueError as e:
+            raise ValueError(f"invalid cron expression '{expression}': {e}")
+        # when both day fields are restricted a day matching either one fires
+        self._day_or = not fields[2].startswith("*") and not fields[4].startswith("*")
+        self.next_after(datetime(2000, 1, 1))
+
+    def _day_matches(self, t):
+        in_days = t.day in self.days
+        in_weekdays = (t.weekday() + 1) % 7 in self.weekdays
+        return (in_days or in_weekdays) if self._day_or else (in_days and in_weekdays)
+
+    def next_after(self, after):
+        # Jumps a whole month, day or hour at a time whenever that field cannot match
+        t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = after.year + CRON_SEARCH_YEARS
+        while t.year <= limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"cron expression '{self.expression}' never fires")
@@ -1,27 +1,15 @@
 print("database.py is running")
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker , declarative_base
+from sqlalchemy.orm import declarative_base
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL=os.getenv("DATABASE_URL")
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
 
-engine = create_engine(DATABASE_URL , echo=True)
-
-SessionLocal = sessionmaker(autocommit=False , autoflush=False, bind=engine)
-
+# One declarative Base shared by the async engine the app runs on
+# (database_async.py) and the sync engine of the scripts (database_sync.py).
+# Nothing here opens an engine, so importing models needs no sync driver.
 Base=declarative_base()
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-        db.commit()  # Optional for GET, safe to keep
-    except:
-        db.rollback()
-        raise
-    finally:
-        db.close()
\ No newline at end of file
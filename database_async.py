@@ -1,7 +1,10 @@
 print("database.py is running...")
 
 from sqlalchemy.ext.asyncio import create_async_engine,AsyncSession
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
+from database import Base, DB_ECHO  # one declarative Base shared by both engines
+from db_metrics import instrument_engine, instrument_pool
 import os
 from dotenv import load_dotenv
 
@@ -9,10 +12,33 @@ load_dotenv()
 
 DATABASE_URL=os.getenv("DATABASE_URL")
 
-print("DATABASE_URL =", repr(DATABASE_URL))
-
-
-engine = create_async_engine(DATABASE_URL, echo=True, connect_args={"ssl": "require"})
+# Pool settings for the async engine; one uvicorn worker holds at most
+# DB_POOL_SIZE + DB_MAX_OVERFLOW connections.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_SSL = os.getenv("DB_SSL", "require")
+
+def async_database_url(url):
+    # postgresql:// and postgresql+psycopg2:// both map to asyncpg
+    url = make_url(url)
+    if url.get_backend_name() == "postgresql":
+        return url.set(drivername="postgresql+asyncpg")
+    return url
+
+ASYNC_DATABASE_URL = async_database_url(DATABASE_URL)
+
+engine_options = {"echo": DB_ECHO}
+if ASYNC_DATABASE_URL.get_backend_name() != "sqlite":
+    engine_options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                          pool_timeout=DB_POOL_TIMEOUT, pool_recycle=DB_POOL_RECYCLE)
+if ASYNC_DATABASE_URL.drivername == "postgresql+asyncpg" and DB_SSL != "disable":
+    engine_options["connect_args"] = {"ssl": DB_SSL}
+
+engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options)
+instrument_engine(engine)
+instrument_pool(engine)
 
 AsyncSessionLocal = sessionmaker(
     bind=engine,
@@ -20,9 +46,7 @@ AsyncSessionLocal = sessionmaker(
     expire_on_commit=False
 )
 
-Base= declarative_base()
-
 
 async def get_db():
     async with AsyncSessionLocal() as session:
-        yield session
\ No newline at end of file
+        yield session
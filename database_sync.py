@@ -0,0 +1,16 @@
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
+from database import DATABASE_URL, DB_ECHO
+from db_metrics import instrument_engine
+
+# Sync engine for scripts such as create_tables.py and migrate.py; the app
+# never imports this module. DATABASE_URL may name an async driver, so the
+# backend's default sync driver is used (psycopg2 for Postgres).
+SYNC_DATABASE_URL = make_url(DATABASE_URL)
+SYNC_DATABASE_URL = SYNC_DATABASE_URL.set(drivername=SYNC_DATABASE_URL.get_backend_name())
+
+engine = create_engine(SYNC_DATABASE_URL , echo=DB_ECHO)
+instrument_engine(engine)
+
+SessionLocal = sessionmaker(autocommit=False , autoflush=False, bind=engine)
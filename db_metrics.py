@@ -0,0 +1,130 @@
+import logging
+import os
+from collections import Counter, deque
+from contextvars import ContextVar
+from time import perf_counter
+
+from sqlalchemy import event
+
+import metrics
+
+logger = logging.getLogger("linistrate.sql")
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+DB_STATS_HISTORY = int(os.getenv("DB_STATS_HISTORY", "200"))
+
+
+class RequestDBStats:
+    def __init__(self, route):
+        self.route = route
+        self.query_count = 0
+        self.total_ms = 0.0
+        self.statements = Counter()
+        self.slow = []
+
+    def record(self, statement, elapsed_ms):
+        self.query_count += 1
+        self.total_ms += elapsed_ms
+        self.statements[statement] += 1
+        if elapsed_ms >= SLOW_QUERY_MS:
+            self.slow.append({"statement": statement, "ms": round(elapsed_ms, 2)})
+
+    def repeated(self):
+        # Same statement text issued many times in one request is the usual
+        # shape of an N+1 (one lazy load per row)
+        return [{"statement": statement, "count": count}
+                for statement, count in self.statements.items() if count >= N_PLUS_ONE_THRESHOLD]
+
+    def summary(self):
+        return {
+            "route": self.route,
+            "queries": self.query_count,
+            "db_ms": round(self.total_ms, 2),
+            "slow": self.slow,
+            "n_plus_one": self.repeated(),
+        }
+
+
+_current = ContextVar("db_stats", default=None)
+recent_requests = deque(maxlen=DB_STATS_HISTORY)
+slow_queries = deque(maxlen=DB_STATS_HISTORY)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (perf_counter() - conn.info["query_start"].pop()) * 1000
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, elapsed_ms)
+    if elapsed_ms >= SLOW_QUERY_MS:
+        route = stats.route if stats is not None else None
+        slow_queries.append({"route": route, "statement": statement, "ms": round(elapsed_ms, 2)})
+        logger.warning("slow query (%.1f ms) on %s: %s", elapsed_ms, route, statement)
+
+
+def _handle_error(context):
+    starts = context.connection.info.get("query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def instrument_engine(engine):
+    # Accepts a sync Engine or an AsyncEngine
+    engine = getattr(engine, "sync_engine", engine)
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def instrument_pool(engine):
+    # Times every pool checkout (waiting for a free connection or opening a
+    # new one) and how long connections stay checked out, and exposes the pool
+    # occupancy as a gauge
+    # raw_connection() is wrapped rather than the pool, which dispose() replaces
+    engine = getattr(engine, "sync_engine", engine)
+    raw_connection = engine.raw_connection
+
+    def timed_raw_connection():
+        start = perf_counter()
+        try:
+            return raw_connection()
+        finally:
+            metrics.db_pool_wait.observe(perf_counter() - start)
+
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.db_pool_checkouts.inc()
+        connection_record.info["checked_out_at"] = perf_counter()
+
+    def on_checkin(dbapi_connection, connection_record):
+        checked_out_at = connection_record.info.pop("checked_out_at", None)
+        if checked_out_at is not None:
+            metrics.db_pool_hold.observe(perf_counter() - checked_out_at)
+
+    def pool_status():
+        return {(state,): getattr(engine.pool, state)() for state in ("size", "checkedin", "checkedout", "overflow")
+                if callable(getattr(engine.pool, state, None))}
+
+    engine.raw_connection = timed_raw_connection
+    event.listen(engine, "checkout", on_checkout)
+    event.listen(engine, "checkin", on_checkin)
+    metrics.Gauge("linistrate_db_pool_connections", "Database pool connections by state.", ("state",), collect=pool_status)
+
+
+def begin_request(route):
+    stats = RequestDBStats(route)
+    return stats, _current.set(stats)
+
+
+def end_request(stats, token, route=None):
+    _current.reset(token)
+    if route:
+        stats.route = route
+    summary = stats.summary()
+    recent_requests.append(summary)
+    for repeated in summary["n_plus_one"]:
+        logger.warning("possible N+1 on %s: %d x %s", stats.route, repeated["count"], repeated["statement"])
+    return summary
@@ -0,0 +1,170 @@
+import asyncio
+import itertools
+import math
+import os
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from time import monotonic
+
+# Every remote command goes through one FairScheduler. At most SCHED_CAPACITY
+# run at once, no more than SCHED_PER_USER for one user and SCHED_PER_ASSET on
+# one asset. Waiting commands are served by start-time fair queuing, so a user
+# with a deep backlog does not delay everyone else. Requests beyond the queue
+# limits are refused instead of piling up.
+SCHED_CAPACITY = int(os.getenv("SCHED_CAPACITY", "200"))
+SCHED_PER_USER = int(os.getenv("SCHED_PER_USER", "20"))
+SCHED_PER_ASSET = int(os.getenv("SCHED_PER_ASSET", "4"))
+SCHED_MAX_QUEUE = int(os.getenv("SCHED_MAX_QUEUE", "1000"))
+SCHED_MAX_QUEUE_PER_USER = int(os.getenv("SCHED_MAX_QUEUE_PER_USER", "500"))
+# "user_id:weight,..." e.g. "1:2,7:0.5"; users not listed get weight 1
+SCHED_USER_WEIGHTS = os.getenv("SCHED_USER_WEIGHTS", "")
+
+
+def _parse_weights(raw):
+    weights = {}
+    for item in filter(None, (part.strip() for part in raw.split(","))):
+        user_id, weight = item.split(":")
+        weights[int(user_id)] = float(weight)
+    return weights
+
+
+class SchedulerBusy(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Execution queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("user_id", "asset_id", "start", "finish", "seq", "future", "enqueued_at")
+
+    def __init__(self, user_id, asset_id, start, finish, seq, future):
+        self.user_id = user_id
+        self.asset_id = asset_id
+        self.start = start
+        self.finish = finish
+        self.seq = seq
+        self.future = future
+        self.enqueued_at = monotonic()
+
+
+class FairScheduler:
+    def __init__(self, capacity=SCHED_CAPACITY, per_user=SCHED_PER_USER, per_asset=SCHED_PER_ASSET,
+                 max_queue=SCHED_MAX_QUEUE, max_queue_per_user=SCHED_MAX_QUEUE_PER_USER,
+                 weights=None):
+        self.capacity = capacity
+        self.per_user = per_user
+        self.per_asset = per_asset
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.weights = _parse_weights(SCHED_USER_WEIGHTS) if weights is None else weights
+        self._queue = []
+        self._seq = itertools.count()
+        self._vtime = 0.0
+        self._last_finish = {}
+        self._running = 0
+        self._running_user = Counter()
+        self._running_asset = Counter()
+        self._running_user_asset = Counter()
+        self._queued_user = Counter()
+        self._waits = deque(maxlen=1000)
+        self._service = deque(maxlen=1000)
+        self.rejected = 0
+
+    def retry_after(self):
+        service = sum(self._service) / len(self._service) if self._service else 1.0
+        return max(1, math.ceil(service * (len(self._queue) + 1) / self.capacity))
+
+    def admit(self, user_id, count=1):
+        # Raises SchedulerBusy when `count` more commands would overflow the queue
+        if (len(self._queue) + count > self.max_queue
+                or self._queued_user[user_id] + count > self.max_queue_per_user):
+            self.rejected += 1
+            raise SchedulerBusy(self.retry_after())
+
+    def _eligible(self, waiter):
+        return (self._running_user[waiter.user_id] < self.per_user
+                and self._running_asset[waiter.asset_id] < self.per_asset)
+
+    def _dispatch(self):
+        if self._running >= self.capacity or not self._queue:
+            return
+        self._queue.sort(key=lambda waiter: (waiter.finish, waiter.seq))
+        remaining = []
+        for waiter in self._queue:
+            if self._running < self.capacity and self._eligible(waiter):
+                self._running += 1
+                self._running_user[waiter.user_id] += 1
+                self._running_asset[waiter.asset_id] += 1
+                self._running_user_asset[waiter.user_id, waiter.asset_id] += 1
+                self._queued_user[waiter.user_id] -= 1
+                self._vtime = max(self._vtime, waiter.start)
+                self._waits.append(monotonic() - waiter.enqueued_at)
+                waiter.future.set_result(None)
+            else:
+                remaining.append(waiter)
+        self._queue = remaining
+
+    def _release(self, user_id, asset_id, started):
+        self._running -= 1
+        self._running_user[user_id] -= 1
+        self._running_asset[asset_id] -= 1
+        self._running_user_asset[user_id, asset_id] -= 1
+        self._service.append(monotonic() - started)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, user_id, asset_id, admit=True):
+        # admit=False is for work that was already admitted as a batch (fan-out,
+        # streams, queued jobs); it still obeys the concurrency caps
+        if admit:
+            self.admit(user_id)
+        start = max(self._vtime, self._last_finish.get(user_id, 0.0))
+        finish = start + 1.0 / self.weights.get(user_id, 1.0)
+        self._last_finish[user_id] = finish
+        waiter = _Waiter(user_id, asset_id, start, finish, next(self._seq),
+                         asyncio.get_running_loop().create_future())
+        self._queue.append(waiter)
+        self._queued_user[user_id] += 1
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(user_id, asset_id, monotonic())
+            else:
+                self._queue.remove(waiter)
+                self._queued_user[user_id] -= 1
+            raise
+        started = monotonic()
+        try:
+            yield
+        finally:
+            self._release(user_id, asset_id, started)
+
+    def stats(self, user_id=None):
+        # Totals plus a per-user breakdown; with user_id the breakdown only
+        # covers that user, so callers never see other users' work
+        waits = sorted(self._waits)
+
+        def percentile(p):
+            if not waits:
+                return None
+            return round(waits[min(int(len(waits) * p), len(waits) - 1)] * 1000, 2)
+
+        def mine(key):
+            return user_id is None or key == user_id
+
+        return {
+            "capacity": self.capacity,
+            "running": self._running,
+            "queued": len(self._queue),
+            "rejected": self.rejected,
+            "queued_by_user": {user: count for user, count in self._queued_user.items() if count and mine(user)},
+            "running_by_user": {user: count for user, count in self._running_user.items() if count and mine(user)},
+            "running_by_asset": {asset_id: count for (user, asset_id), count in self._running_user_asset.items()
+                                 if count and mine(user)},
+            "wait_ms": {"p50": percentile(0.50), "p95": percentile(0.95), "p99": percentile(0.99)},
+            "retry_after": self.retry_after(),
+        }
+
+scheduler = FairScheduler()
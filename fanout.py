@@ -0,0 +1,39 @@
+import asyncio
+import json
+
+from history import result_status, save_executions, timing_values
+from output_store import capture_output
+
+# Body of the NDJSON fan-out endpoints (command-request-fanout and script
+# runs). run_one(target) returns (asset_id, ip, response, elapsed); one JSON
+# line is yielded per host in completion order, and the history rows are
+# written once every host is done, or for the hosts that finished when the
+# client disconnects first.
+
+
+async def stream_fanout(targets, run_one, owner_id, describe, command=None):
+    # describe(response) gives the endpoint's own fields for a result line;
+    # the history row uses `command`, or the response's when it has none
+    rows = []
+    tasks = [asyncio.ensure_future(run_one(target)) for target in targets]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            asset_id, ip, response, elapsed = await next_done
+            status = result_status(response)
+            durations = timing_values(elapsed, response)
+            stored = await asyncio.to_thread(capture_output, response["output"])
+            rows.append(dict(command=command or response["command"], error=response["error"], asset_id=asset_id,
+                             owner_id=owner_id, status=status, **durations, **stored))
+            yield json.dumps({
+                "asset_id": asset_id,
+                "ip": ip,
+                **describe(response),
+                "status": status,
+                "duration": durations["duration"],
+                "output": response["output"].splitlines(),
+                "error": response["error"],
+            }) + "\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+        await save_executions(rows)
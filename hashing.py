@@ -0,0 +1,76 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+import bcrypt
+
+import metrics
+
+# bcrypt runs in its own process pool so a login storm costs queue slots,
+# not event loop time or Starlette threadpool threads. Queue depth, rejections
+# and latency are exported on /metrics (linistrate_hash_*).
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(max((os.cpu_count() or 2) // 2, 1))))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", "64"))
+HASH_RETRY_AFTER = int(os.getenv("HASH_RETRY_AFTER", "1"))
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def hash_password(plain_password: str) -> str:
+    return bcrypt.hashpw(plain_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+
+_executor = None
+_lock = threading.Lock()
+_pending = 0
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+    return _executor
+
+
+async def _submit(fn, *args):
+    global _pending
+    with _lock:
+        if _pending >= HASH_MAX_PENDING:
+            metrics.hash_rejected.inc()
+            raise HashingBusy()
+        _pending += 1
+    metrics.hash_pending.inc()
+    start = perf_counter()
+    try:
+        return await asyncio.wrap_future(_get_executor().submit(fn, *args))
+    finally:
+        with _lock:
+            _pending -= 1
+        metrics.hash_pending.dec()
+        metrics.hash_duration.observe(perf_counter() - start)
+
+
+async def hash_password_async(plain_password: str) -> str:
+    return await _submit(hash_password, plain_password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _submit(verify_password, plain_password, hashed_password)
+
+
+def shutdown():
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import os
+import random
+from datetime import datetime, timedelta
+from time import perf_counter
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from Command import SSH_PORT
+from database_async import AsyncSessionLocal
+from models import Asset, AssetHealth
+
+logger = logging.getLogger("linistrate.health")
+
+# Every HEALTH_INTERVAL seconds (+/- HEALTH_JITTER of it) each active asset is
+# probed with a TCP connect to the SSH port and a read of the server banner,
+# at most HEALTH_CONCURRENCY at a time. Results are kept in memory for the API
+# and upserted into asset_health so they survive a restart.
+HEALTH_ENABLED = os.getenv("HEALTH_ENABLED", "true").lower() == "true"
+HEALTH_INTERVAL = float(os.getenv("HEALTH_INTERVAL", "60"))
+HEALTH_JITTER = float(os.getenv("HEALTH_JITTER", "0.2"))
+HEALTH_CONCURRENCY = int(os.getenv("HEALTH_CONCURRENCY", "50"))
+HEALTH_TIMEOUT = float(os.getenv("HEALTH_TIMEOUT", "5"))
+# consecutive failed probes before commands to the host are refused
+HEALTH_FAILURES_DOWN = int(os.getenv("HEALTH_FAILURES_DOWN", "2"))
+# results older than this are not trusted for failing fast
+HEALTH_STALE_AFTER = float(os.getenv("HEALTH_STALE_AFTER", str(3 * HEALTH_INTERVAL)))
+
+UP, DOWN = "up", "down"
+
+
+async def probe(ip, port=SSH_PORT, timeout=HEALTH_TIMEOUT):
+    start = perf_counter()
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+        connect_ms = round((perf_counter() - start) * 1000, 2)
+        banner = await asyncio.wait_for(reader.readline(), timeout)
+        if not banner.startswith(b"SSH-"):
+            return {"status": DOWN, "latency_ms": connect_ms, "error": "No SSH banner"}
+        # identify ourselves before hanging up so the server logs a plain disconnect
+        writer.write(b"SSH-2.0-linistrate-probe\r\n")
+        return {"status": UP, "latency_ms": connect_ms, "error": None}
+    except asyncio.TimeoutError:
+        return {"status": DOWN, "latency_ms": None, "error": f"Timed out after {timeout}s"}
+    except OSError as e:
+        return {"status": DOWN, "latency_ms": None, "error": str(e) or e.__class__.__name__}
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+class HealthMonitor:
+    def __init__(self, interval=HEALTH_INTERVAL, concurrency=HEALTH_CONCURRENCY):
+        self.interval = interval
+        self.concurrency = concurrency
+        self._results = {}    # asset_id -> latest result
+        self._task = None
+
+    def get(self, asset_id):
+        return self._results.get(asset_id)
+
+    def is_down(self, asset_id):
+        result = self._results.get(asset_id)
+        return (result is not None and result["status"] == DOWN
+                and result["consecutive_failures"] >= HEALTH_FAILURES_DOWN
+                and datetime.utcnow() - result["checked_at"] < timedelta(seconds=HEALTH_STALE_AFTER))
+
+    def start(self):
+        if HEALTH_ENABLED:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        try:
+            await self._load()
+        except Exception:
+            logger.exception("loading stored asset health failed")
+        while True:
+            try:
+                await self.check_all()
+            except Exception:
+                logger.exception("asset health cycle failed")
+            await asyncio.sleep(self.interval * random.uniform(1 - HEALTH_JITTER, 1 + HEALTH_JITTER))
+
+    async def _load(self):
+        async with AsyncSessionLocal() as db:
+            for row in (await db.execute(select(AssetHealth))).scalars():
+                self._results[row.asset_id] = {
+                    "status": row.status, "latency_ms": row.latency_ms, "error": row.error,
+                    "checked_at": row.checked_at, "last_up_at": row.last_up_at,
+                    "consecutive_failures": row.consecutive_failures,
+                }
+
+    def _record(self, asset_id, result):
+        previous = self._results.get(asset_id, {})
+        now = datetime.utcnow()
+        result["checked_at"] = now
+        result["last_up_at"] = now if result["status"] == UP else previous.get("last_up_at")
+        result["consecutive_failures"] = 0 if result["status"] == UP else previous.get("consecutive_failures", 0) + 1
+        self._results[asset_id] = result
+        return result
+
+    async def check(self, targets):
+        # targets: [(asset_id, ip)]; probes start spread over the first part of
+        # the interval so a large fleet is not hit in one burst
+        limit = asyncio.Semaphore(self.concurrency)
+        spread = self.interval * HEALTH_JITTER if len(targets) > self.concurrency else 0
+
+        async def check_one(asset_id, ip):
+            await asyncio.sleep(random.uniform(0, spread))
+            async with limit:
+                return asset_id, self._record(asset_id, await probe(ip))
+
+        results = dict(await asyncio.gather(*(check_one(asset_id, ip) for asset_id, ip in targets)))
+        await self._save(results)
+        return results
+
+    async def check_all(self):
+        async with AsyncSessionLocal() as db:
+            targets = (await db.execute(select(Asset.asset_id, Asset.ip).filter(Asset.is_active == True))).all()
+        active = {asset_id for asset_id, _ in targets}
+        for asset_id in list(self._results):
+            if asset_id not in active:
+                del self._results[asset_id]
+        return await self.check(targets)
+
+    async def _save(self, results):
+        if not results:
+            return
+        rows = [dict(asset_id=asset_id, **result) for asset_id, result in results.items()]
+        async with AsyncSessionLocal() as db:
+            dialect_insert = postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+            for i in range(0, len(rows), 500):
+                statement = dialect_insert(AssetHealth).values(rows[i:i + 500])
+                await db.execute(statement.on_conflict_do_update(
+                    index_elements=["asset_id"],
+                    set_={name: statement.excluded[name] for name in rows[0] if name != "asset_id"},
+                ))
+            await db.commit()
+
+    def summary(self, asset_ids):
+        counts = {UP: 0, DOWN: 0, "unknown": 0}
+        for asset_id in asset_ids:
+            result = self._results.get(asset_id)
+            counts[result["status"] if result else "unknown"] += 1
+        return counts
+
+
+health_monitor = HealthMonitor()
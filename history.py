@@ -0,0 +1,154 @@
+import os
+from bisect import bisect_left
+from datetime import datetime
+
+import anyio
+from sqlalchemy import insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database_async import AsyncSessionLocal
+from models import Asset, CommandOutput, CommandRequest, ExecutionRollup
+
+# Every finished execution is written through record_executions() or
+# finish_execution(), which also add it to execution_rollup in the same
+# transaction. Statistics then read a few rollup rows per scope instead of
+# scanning command_request.
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 300000)
+ROLLUP_STATUSES = ("success", "failed", "timeout")
+ROLLUP_SCOPES = ("asset", "group", "command")
+ROLLUP_COMMAND_CHARS = int(os.getenv("ROLLUP_COMMAND_CHARS", "200"))
+ROLLUP_COUNTERS = ("count", "success", "failed", "timeout", "duration_ms_sum")
+ROLLUP_KEY = ("owner_id", "scope", "scope_key", "period_start", "bucket")
+# rows per upsert statement, well under SQLite's bound-parameter limit
+UPSERT_CHUNK = 500
+
+
+def result_status(response):
+    if response.get("timed_out"):
+        return "timeout"
+    return "failed" if response["error"] else "success"
+
+
+def timing_values(elapsed, response=None):
+    values = {"duration": f"{elapsed:.2f}s", "duration_ms": round(elapsed * 1000, 2)}
+    if response is not None:
+        values["connect_ms"] = response.get("connect_ms")
+        values["exec_ms"] = response.get("exec_ms")
+    return values
+
+
+def latency_bucket(duration_ms):
+    # the last index is the overflow bucket above the largest bound
+    return bisect_left(LATENCY_BUCKETS_MS, duration_ms)
+
+
+def rollup_increments(rows, group_ids):
+    # Folds command_request rows (dicts) into one increment per rollup key
+    increments = {}
+    now = datetime.utcnow()
+    for row in rows:
+        if row.get("status") not in ROLLUP_STATUSES or row.get("duration_ms") is None:
+            continue
+        period = (row.get("created_at") or now).replace(minute=0, second=0, microsecond=0)
+        bucket = latency_bucket(row["duration_ms"])
+        scopes = (
+            ("asset", row.get("asset_id")),
+            ("group", group_ids.get(row.get("asset_id"))),
+            ("command", (row.get("command") or "")[:ROLLUP_COMMAND_CHARS]),
+        )
+        for scope, key in scopes:
+            if key is None:
+                continue
+            counters = increments.setdefault((row["owner_id"], scope, str(key), period, bucket),
+                                              dict.fromkeys(ROLLUP_COUNTERS, 0))
+            counters["count"] += 1
+            counters[row["status"]] += 1
+            counters["duration_ms_sum"] += row["duration_ms"]
+    return [dict(zip(ROLLUP_KEY, key), **counters) for key, counters in increments.items()]
+
+
+def rollup_upserts(dialect, increments):
+    # INSERT .. ON CONFLICT DO UPDATE adding to the existing counters; both
+    # Postgres and SQLite support it
+    dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    for i in range(0, len(increments), UPSERT_CHUNK):
+        statement = dialect_insert(ExecutionRollup).values(increments[i:i + UPSERT_CHUNK])
+        yield statement.on_conflict_do_update(
+            index_elements=list(ROLLUP_KEY),
+            set_={name: getattr(ExecutionRollup, name) + statement.excluded[name] for name in ROLLUP_COUNTERS},
+        )
+
+
+async def _add_to_rollups(db, rows):
+    asset_ids = {row.get("asset_id") for row in rows if row.get("asset_id") is not None}
+    group_ids = dict((await db.execute(
+        select(Asset.asset_id, Asset.group_id).filter(Asset.asset_id.in_(asset_ids))
+    )).all()) if asset_ids else {}
+    for statement in rollup_upserts(db.bind.dialect.name, rollup_increments(rows, group_ids)):
+        await db.execute(statement)
+
+
+async def store_outputs(db, contents):
+    # command_output rows from output_store; content already stored under the
+    # same hash is left alone
+    contents = list({content["output_hash"]: content for content in contents if content}.values())
+    if not contents:
+        return
+    dialect_insert = postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+    for i in range(0, len(contents), UPSERT_CHUNK):
+        await db.execute(dialect_insert(CommandOutput).values(contents[i:i + UPSERT_CHUNK])
+                         .on_conflict_do_nothing(index_elements=["output_hash"]))
+
+
+async def record_executions(db, rows):
+    # rows are dicts of command_request values plus the optional
+    # "output_content" from output_store; the caller commits
+    if not rows:
+        return
+    rows = [dict(row) for row in rows]
+    await store_outputs(db, [row.pop("output_content", None) for row in rows])
+    await db.execute(insert(CommandRequest), rows)
+    await _add_to_rollups(db, rows)
+
+
+async def save_executions(rows):
+    # For streaming responses, which write their rows from a finally block: a
+    # client disconnect cancels the response task, and the shield keeps that
+    # cancellation from also abandoning the insert in its own session
+    if not rows:
+        return
+    with anyio.CancelScope(shield=True):
+        async with AsyncSessionLocal() as session:
+            await record_executions(session, rows)
+            await session.commit()
+
+
+async def finish_execution(db, command_id, values):
+    # Final update of a row created earlier (queued jobs); the caller commits
+    values = dict(values)
+    await store_outputs(db, [values.pop("output_content", None)])
+    row = (await db.execute(
+        update(CommandRequest).where(CommandRequest.command_id == command_id).values(**values)
+        .returning(CommandRequest.owner_id, CommandRequest.asset_id, CommandRequest.command, CommandRequest.created_at)
+    )).mappings().first()
+    if row is not None:
+        await _add_to_rollups(db, [{**row, **values}])
+
+
+def latency_percentile(bucket_counts, p):
+    # Approximates a percentile from bucket counts, interpolating inside the
+    # bucket it falls in; the overflow bucket reports the largest bound
+    total = sum(bucket_counts.values())
+    if not total:
+        return None
+    target = p * total
+    seen = 0
+    for bucket in sorted(bucket_counts):
+        count = bucket_counts[bucket]
+        if seen + count >= target:
+            if bucket >= len(LATENCY_BUCKETS_MS):
+                return float(LATENCY_BUCKETS_MS[-1])
+            low = LATENCY_BUCKETS_MS[bucket - 1] if bucket else 0
+            return round(low + (LATENCY_BUCKETS_MS[bucket] - low) * (target - seen) / count, 2)
+        seen += count
+    return float(LATENCY_BUCKETS_MS[-1])
@@ -0,0 +1,193 @@
+import asyncio
+import itertools
+import logging
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from time import perf_counter
+
+from sqlalchemy import func, select, update
+
+from Command import execute_remote_command_async
+from database_async import AsyncSessionLocal
+from fair_scheduler import scheduler
+from history import finish_execution, result_status, timing_values
+from models import Asset, CommandRequest
+from output_store import capture_output
+from utils import decrypt_data
+
+logger = logging.getLogger("linistrate.jobs")
+
+# Jobs are command_request rows. The table is the queue, so anything still
+# "queued" when the process stops is picked up again on the next start.
+# Workers claim round-robin across users (oldest job first within a user) and
+# skip users already at SCHED_PER_USER here, so one user's backlog cannot
+# occupy every worker while other users' jobs wait unclaimed.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "16"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+JOB_DEFAULT_TIMEOUT = float(os.getenv("JOB_DEFAULT_TIMEOUT", "600"))
+JOB_STALE_GRACE = float(os.getenv("JOB_STALE_GRACE", "60"))
+
+QUEUED, RUNNING, SUCCESS, FAILED, TIMEOUT, CANCELLED = "queued", "running", "success", "failed", "timeout", "cancelled"
+FINISHED = (SUCCESS, FAILED, TIMEOUT, CANCELLED)
+
+
+class JobQueue:
+    def __init__(self, workers=JOB_WORKERS, poll_interval=JOB_POLL_INTERVAL):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+        self._running = {}    # job id -> task executing it in this process
+        self._running_users = Counter()    # owner id -> jobs running in this process
+        self._served = {}                  # owner id -> turn of their last claim
+        self._turns = itertools.count(1)
+
+    async def enqueue(self, db, command, asset_id, owner_id, timeout=None):
+        job = CommandRequest(command=command, asset_id=asset_id, owner_id=owner_id, status=QUEUED,
+                             duration="0.00s", timeout=timeout or JOB_DEFAULT_TIMEOUT)
+        db.add(job)
+        await db.commit()
+        self._wakeup.set()
+        return job
+
+    async def cancel(self, db, job_id):
+        # Queued jobs are cancelled in the table; running ones by cancelling
+        # their task, which records the final status itself
+        result = await db.execute(
+            update(CommandRequest)
+            .where(CommandRequest.command_id == job_id, CommandRequest.status == QUEUED)
+            .values(status=CANCELLED, finished_at=datetime.utcnow())
+        )
+        await db.commit()
+        if result.rowcount:
+            return True
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+            return True
+        return False
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._poller()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _poller(self):
+        # Wakes idle workers periodically so jobs enqueued by other processes,
+        # or left over from a restart, are not missed
+        while True:
+            try:
+                await self._fail_stale()
+            except Exception:
+                logger.exception("stale job sweep failed")
+            await asyncio.sleep(self.poll_interval)
+            self._wakeup.set()
+
+    async def _fail_stale(self):
+        # A running job past its timeout was owned by a process that died
+        async with AsyncSessionLocal() as db:
+            running = (await db.execute(
+                select(CommandRequest.command_id, CommandRequest.started_at, CommandRequest.timeout)
+                .filter(CommandRequest.status == RUNNING)
+            )).all()
+            now = datetime.utcnow()
+            stale = [job_id for job_id, started_at, timeout in running
+                     if job_id not in self._running and started_at is not None
+                     and started_at + timedelta(seconds=(timeout or JOB_DEFAULT_TIMEOUT) + JOB_STALE_GRACE) < now]
+            if stale:
+                await db.execute(
+                    update(CommandRequest)
+                    .where(CommandRequest.command_id.in_(stale), CommandRequest.status == RUNNING)
+                    .values(status=FAILED, error="Worker stopped while the job was running", finished_at=now)
+                )
+                await db.commit()
+
+    async def _claim(self):
+        # Returns (job id, owner id) or None when nothing can be claimed now
+        async with AsyncSessionLocal() as db:
+            while True:
+                heads = (await db.execute(
+                    select(CommandRequest.owner_id, func.min(CommandRequest.command_id))
+                    .filter(CommandRequest.status == QUEUED)
+                    .group_by(CommandRequest.owner_id)
+                )).all()
+                heads = [(owner_id, job_id) for owner_id, job_id in heads
+                         if self._running_users[owner_id] < scheduler.per_user]
+                if not heads:
+                    return None
+                # fewest running first, then whoever was served longest ago
+                owner_id, job_id = min(heads, key=lambda head: (self._running_users[head[0]], self._served.get(head[0], 0)))
+                # Conditional update so two workers never run the same job
+                result = await db.execute(
+                    update(CommandRequest)
+                    .where(CommandRequest.command_id == job_id, CommandRequest.status == QUEUED)
+                    .values(status=RUNNING, started_at=datetime.utcnow())
+                )
+                await db.commit()
+                if result.rowcount:
+                    self._served[owner_id] = next(self._turns)
+                    self._running_users[owner_id] += 1
+                    return job_id, owner_id
+
+    async def _worker(self):
+        while True:
+            claimed = await self._claim()
+            if claimed is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            job_id, owner_id = claimed
+            task = asyncio.create_task(self._run(job_id))
+            self._running[job_id] = task
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.done():
+                    # the worker itself is being stopped
+                    task.cancel()
+                    raise
+            except Exception:
+                logger.exception("job %s crashed", job_id)
+            finally:
+                self._running.pop(job_id, None)
+                self._running_users[owner_id] -= 1
+                # a user below the cap again may have jobs waiting
+                self._wakeup.set()
+
+    async def _run(self, job_id):
+        async with AsyncSessionLocal() as db:
+            job = await db.get(CommandRequest, job_id)
+            asset = await db.get(Asset, job.asset_id)
+            start = perf_counter()
+            values, timings = {}, {}
+            try:
+                async with scheduler.slot(job.owner_id, job.asset_id, admit=False):
+                    start = perf_counter()
+                    response = await execute_remote_command_async(
+                        hostname=asset.ip, username=asset.username, password=decrypt_data(asset.password),
+                        command=job.command, timeout=job.timeout,
+                    )
+                timings = response
+                status = result_status(response)
+                values = await asyncio.to_thread(capture_output, response["output"])
+                values["error"] = response["error"]
+            except asyncio.CancelledError:
+                status = CANCELLED
+                values["error"] = "Cancelled"
+                raise
+            except Exception as e:
+                status = FAILED
+                values["error"] = str(e)
+            finally:
+                values.update(status=status, finished_at=datetime.utcnow(), **timing_values(perf_counter() - start, timings))
+                await finish_execution(db, job_id, values)
+                await db.commit()
+
+
+job_queue = JobQueue()
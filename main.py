@@ -1,7 +1,19 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from routers import users, assets, commands ,groups , blogs , technologies
+from routers import users, assets, commands ,groups , blogs , technologies , debug , schedules , scripts
 from auth import get_current_user, custom_openapi  # import from your new auth.py
+from Command import ssh_pool
+from jobs import job_queue
+from schedules import schedule_runner
+from health import health_monitor
+from hashing import HashingBusy, HASH_RETRY_AFTER
+from fair_scheduler import SchedulerBusy
+import hashing
+import db_metrics
+import metrics
+import profiling
+import secrets
 import logging
 
 app = FastAPI()
@@ -12,13 +24,59 @@ origins = ["http://localhost:8080"]
 def show_routes():
     for route in app.routes:
         logging.info(f"Route: {route.methods} {route.path}")
-        
+
+@app.on_event("startup")
+def start_job_queue():
+    job_queue.start()
+    schedule_runner.start()
+    health_monitor.start()
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    await health_monitor.stop()
+    await schedule_runner.stop()
+    await job_queue.stop()
+    ssh_pool.close_all()
+    hashing.shutdown()
+
+@app.exception_handler(HashingBusy)
+def hashing_busy(request: Request, exc: HashingBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many password operations in progress, try again shortly"},
+        headers={"Retry-After": str(HASH_RETRY_AFTER)},
+    )
+
+@app.exception_handler(SchedulerBusy)
+def scheduler_busy(request: Request, exc: SchedulerBusy):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.middleware("http")
+async def db_instrumentation(request: Request, call_next):
+    stats, token = db_metrics.begin_request(request.url.path)
+    try:
+        response = await call_next(request)
+    finally:
+        route = request.scope.get("route")
+        summary = db_metrics.end_request(stats, token, route=getattr(route, "path", None))
+    response.headers["X-DB-Queries"] = str(summary["queries"])
+    response.headers["X-DB-Time-ms"] = str(summary["db_ms"])
+    return response
+
+app.add_middleware(metrics.RequestMetricsMiddleware)
+app.add_middleware(profiling.ProfilingMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-DB-Queries", "X-DB-Time-ms", "X-Profile-Id"],
 )
 
 app.include_router(users.router, tags=["users"])
@@ -27,6 +85,19 @@ app.include_router(commands.router, tags=["commands"])
 app.include_router(groups.router, tags=["groups"])
 app.include_router(blogs.router, tags=["blogs"])
 app.include_router(technologies.router, tags=["technologies"])
+app.include_router(schedules.router, tags=["schedules"])
+app.include_router(scripts.router, tags=["scripts"])
+app.include_router(debug.router, tags=["debug"])
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics(request: Request):
+    # Prometheus scrape target, served only when METRICS_TOKEN is set and sent
+    # as a bearer token; the series name routes and hosts of the fleet
+    if not metrics.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not secrets.compare_digest(request.headers.get("authorization", ""), f"Bearer {metrics.METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 app.openapi = lambda: custom_openapi(app)
 
@@ -0,0 +1,208 @@
+import os
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+# Process-wide metrics in the Prometheus text exposition format, served at
+# /metrics to clients presenting METRICS_TOKEN (not at all while it is unset).
+# Label values must come from small sets (route templates, methods, phases,
+# hosts of the fleet), never from request data.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name}{labels} {_number(value)}" for name, labels, value in self._samples()]
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, _labels(self.labelnames, key), value) for key, value in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        # collect(), when given, returns {label values tuple: value} at scrape time
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        if self.collect is not None:
+            items += list(self.collect().items())
+        return [(self.name, _labels(self.labelnames, key), value) for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # per-bucket counts (last is +Inf), sum, count
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        samples = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", _labels(self.labelnames, key, [("le", _number(bound))]), cumulative))
+            samples.append((f"{self.name}_sum", _labels(self.labelnames, key), total))
+            samples.append((f"{self.name}_count", _labels(self.labelnames, key), count))
+        return samples
+
+
+def render():
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+class RequestMetricsMiddleware:
+    # Plain ASGI middleware so a request counts as in flight, and its latency
+    # runs, until the last body chunk is sent, streaming responses included
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc(method=method)
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # the router stores the matched route in the scope; unmatched
+            # paths share one label so scanners cannot add series
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_request_duration.observe(perf_counter() - start, method=method, route=route, status=str(status[0]))
+            http_requests_in_flight.dec(method=method)
+
+
+http_request_duration = Histogram(
+    "linistrate_http_request_duration_seconds",
+    "Time from receiving a request until its response body is sent, by route template.",
+    ("method", "route", "status"),
+)
+http_requests_in_flight = Gauge(
+    "linistrate_http_requests_in_flight",
+    "Requests currently being handled, including streaming bodies still being sent.",
+    ("method",),
+)
+
+db_pool_checkouts = Counter("linistrate_db_pool_checkouts_total", "Connections handed out by the pool.")
+db_pool_wait = Histogram(
+    "linistrate_db_pool_wait_seconds",
+    "Time spent waiting for a pooled database connection, including opening a new one.",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0),
+)
+db_pool_hold = Histogram(
+    "linistrate_db_pool_hold_seconds",
+    "Time a connection stays checked out before it is returned to the pool.",
+)
+
+hash_pending = Gauge("linistrate_hash_pending", "bcrypt calls queued or running in the hashing process pool.")
+hash_rejected = Counter("linistrate_hash_rejected_total", "bcrypt calls refused with 503 because HASH_MAX_PENDING were outstanding.")
+hash_duration = Histogram(
+    "linistrate_hash_duration_seconds",
+    "Time from submitting a bcrypt call to the pool until its result, queueing included.",
+)
+
+# SSH phases: connect = TCP connect, auth = key exchange plus authentication,
+# exec = opening the channel and starting the command, read = command start
+# until the remote side closes. connect/auth are only observed for new pooled
+# connections. The histogram has no host label to keep its series count down;
+# per-host sums and counts give the average per phase for each host.
+ssh_phase_duration = Histogram("linistrate_ssh_phase_seconds", "SSH time per phase across all hosts.", ("phase",))
+ssh_host_phase_seconds = Counter("linistrate_ssh_host_phase_seconds_total", "SSH time per phase and host.", ("host", "phase"))
+ssh_host_phase_count = Counter("linistrate_ssh_host_phase_count_total", "SSH phase observations per host.", ("host", "phase"))
+ssh_errors = Counter("linistrate_ssh_errors_total", "SSH failures by the phase they happened in.", ("host", "phase"))
+
+
+def observe_ssh_phase(host, phase, seconds):
+    ssh_phase_duration.observe(seconds, phase=phase)
+    ssh_host_phase_seconds.inc(seconds, host=host, phase=phase)
+    ssh_host_phase_count.inc(host=host, phase=phase)
@@ -0,0 +1,169 @@
+# Brings an existing database up to date with models.py. Creates missing
+# tables, columns and indexes, backfills command_request.duration_ms from the
+# old duration strings and blogs.blog_updated_at from the creation time,
+# moves command output into content-addressed storage and rebuilds
+# execution_rollup from the history.
+# Safe to run again; the rollup rebuild always starts from scratch.
+from sqlalchemy import bindparam, delete, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from database import Base
+from database_sync import engine
+from history import ROLLUP_STATUSES, rollup_increments, rollup_upserts
+from models import Asset, Blog, CommandOutput, CommandRequest, ExecutionRollup
+from output_store import blob_digest, link_blob, remove_blob, stored_output
+from search import create_search_index
+
+BATCH_SIZE = 5000
+
+
+def add_missing_columns(conn):
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                # added as nullable without constraints; the code copes with NULLs
+                column_type = column.type.compile(dialect=conn.dialect)
+                conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+                print(f"  added {table.name}.{column.name}")
+
+
+def add_missing_indexes(conn):
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=conn, checkfirst=True)
+
+
+def parse_duration(duration):
+    try:
+        return round(float(duration.rstrip("s")) * 1000, 2)
+    except (AttributeError, ValueError):
+        return None
+
+
+def backfill_duration_ms(conn):
+    statement = (
+        update(CommandRequest.__table__)
+        .where(CommandRequest.__table__.c.command_id == bindparam("row_id"))
+        .values(duration_ms=bindparam("ms"))
+    )
+    last_id, total = 0, 0
+    while True:
+        rows = conn.execute(
+            select(CommandRequest.command_id, CommandRequest.duration)
+            .filter(CommandRequest.command_id > last_id, CommandRequest.duration_ms.is_(None))
+            .order_by(CommandRequest.command_id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            return total
+        last_id = rows[-1].command_id
+        values = [{"row_id": row.command_id, "ms": parse_duration(row.duration)} for row in rows]
+        values = [value for value in values if value["ms"] is not None]
+        if values:
+            conn.execute(statement, values)
+        total += len(values)
+
+
+def backfill_blog_updated_at(conn):
+    return conn.execute(
+        update(Blog).where(Blog.blog_updated_at.is_(None)).values(blog_updated_at=Blog.blog_created_at)
+    ).rowcount
+
+
+def dedupe_outputs(conn):
+    # Gives every row its output_hash, moves inline output longer than
+    # OUTPUT_PREVIEW_BYTES into command_output and renames spooled blobs to
+    # their hash. Commits per batch; a blob made redundant is only removed once
+    # nothing references it.
+    table = CommandRequest.__table__
+    statement = (
+        update(table)
+        .where(table.c.command_id == bindparam("row_id"))
+        .values(output=bindparam("new_output"), output_truncated=bindparam("truncated"),
+                output_hash=bindparam("hash"), output_path=bindparam("path"))
+    )
+    dialect_insert = postgresql.insert if conn.dialect.name == "postgresql" else sqlite.insert
+    last_id, total = 0, 0
+    while True:
+        rows = conn.execute(
+            select(CommandRequest.command_id, CommandRequest.output, CommandRequest.output_path,
+                   CommandRequest.output_size, CommandRequest.output_truncated)
+            .filter(CommandRequest.command_id > last_id, CommandRequest.output_hash.is_(None))
+            .order_by(CommandRequest.command_id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            return total
+        last_id = rows[-1].command_id
+        values, contents, replaced = [], {}, []
+        for row in rows:
+            if row.output_path:
+                output_hash = blob_digest(row.output_path)
+                name = link_blob(row.output_path, output_hash)
+                if name != row.output_path:
+                    replaced.append(row.output_path)
+                contents[output_hash] = {"output_hash": output_hash, "output_size": row.output_size or 0,
+                                         "output": None, "output_path": name}
+                values.append({"row_id": row.command_id, "new_output": row.output, "truncated": True,
+                               "hash": output_hash, "path": name})
+            elif row.output:
+                stored = stored_output(row.output, row.output_size)
+                if stored["output_content"]:
+                    contents[stored["output_hash"]] = stored["output_content"]
+                values.append({"row_id": row.command_id, "new_output": stored["output"],
+                               "truncated": stored["output_truncated"], "hash": stored["output_hash"], "path": None})
+        contents = list(contents.values())
+        for i in range(0, len(contents), 500):
+            conn.execute(dialect_insert(CommandOutput).values(contents[i:i + 500])
+                         .on_conflict_do_nothing(index_elements=["output_hash"]))
+        if values:
+            conn.execute(statement, values)
+        conn.commit()
+        for name in replaced:
+            remove_blob(name)
+        total += len(values)
+
+
+def rebuild_rollups(conn):
+    conn.execute(delete(ExecutionRollup))
+    group_ids = dict(conn.execute(select(Asset.asset_id, Asset.group_id)).all())
+    last_id, total = 0, 0
+    while True:
+        rows = conn.execute(
+            select(CommandRequest.command_id, CommandRequest.owner_id, CommandRequest.asset_id, CommandRequest.command,
+                   CommandRequest.status, CommandRequest.duration_ms, CommandRequest.created_at)
+            .filter(CommandRequest.command_id > last_id, CommandRequest.status.in_(ROLLUP_STATUSES),
+                    CommandRequest.duration_ms.isnot(None))
+            .order_by(CommandRequest.command_id)
+            .limit(BATCH_SIZE)
+        ).mappings().all()
+        if not rows:
+            return total
+        last_id = rows[-1]["command_id"]
+        for statement in rollup_upserts(conn.dialect.name, rollup_increments(rows, group_ids)):
+            conn.execute(statement)
+        total += len(rows)
+
+
+if __name__ == "__main__":
+    print("Creating missing tables")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        print("Adding missing columns")
+        add_missing_columns(conn)
+        print("Adding missing indexes")
+        # first, so pg_trgm exists before the trigram index is created
+        create_search_index(conn)
+        add_missing_indexes(conn)
+    with engine.begin() as conn:
+        print(f"Backfilled duration_ms on {backfill_duration_ms(conn)} rows")
+        print(f"Backfilled blog_updated_at on {backfill_blog_updated_at(conn)} rows")
+    with engine.connect() as conn:
+        print(f"Deduplicated output on {dedupe_outputs(conn)} rows")
+    with engine.begin() as conn:
+        print(f"Rebuilt rollups from {rebuild_rollups(conn)} rows")
+    print("Migration done")
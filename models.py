@@ -1,4 +1,4 @@
-from sqlalchemy import Column , Integer , String , Boolean , ForeignKey , DateTime
+from sqlalchemy import Column , Integer , String , Boolean , ForeignKey , DateTime , Index , Float , DDL , event , func , literal_column , UniqueConstraint
 from database import Base
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID
@@ -36,7 +36,7 @@ class Asset(Base):
 
     # foreign key to user table
     owner_id = Column(Integer, ForeignKey("users.user_id"))
-    group_id = Column(Integer, ForeignKey("groups.group_id"))
+    group_id = Column(Integer, ForeignKey("groups.group_id"), index=True)
     # relationships
     owners_r = relationship("User", back_populates="assets_r")
     commands_r = relationship("CommandRequest", back_populates="assets_r")
@@ -44,6 +44,17 @@ class Asset(Base):
     blogs_r = relationship("Blog", back_populates="assets_r")
     technologies_r = relationship("Technology", back_populates="assets_r")
 
+class AssetHealth(Base):
+    # latest reachability probe per asset, written by health.py
+    __tablename__ = "asset_health"
+    asset_id = Column(Integer, ForeignKey("assets.asset_id"), primary_key=True)
+    status = Column(String, nullable=False)            # "up" or "down"
+    latency_ms = Column(Float, nullable=True)          # TCP connect to the SSH port
+    error = Column(String, nullable=True)
+    checked_at = Column(DateTime, nullable=False)
+    last_up_at = Column(DateTime, nullable=True)
+    consecutive_failures = Column(Integer, nullable=False, default=0)
+
 class Group(Base):
     __tablename__ = "groups"
 
@@ -58,16 +69,43 @@ class Group(Base):
     assets_r = relationship("Asset", back_populates="group_r")
     owners_r = relationship("User", back_populates="group_r")
 
+# Full-text search over command history (queries are in search.py). Postgres
+# indexes the concatenated text as a tsvector and as trigrams; queries must
+# build the exact same expressions for the planner to use them. SQLite gets an
+# FTS5 table kept in sync by triggers.
+def command_search_text(command, output, error):
+    empty, space = literal_column("''"), literal_column("' '")
+    return (func.coalesce(command, empty) + space + func.coalesce(output, empty)
+            + space + func.coalesce(error, empty))
+
+def command_search_vector(search_text):
+    return func.to_tsvector(literal_column("'simple'::regconfig"), search_text)
+
 class CommandRequest(Base):
     __tablename__ = "command_request"
     command_id = Column(Integer, primary_key=True, index=True)
     command = Column(String)
     status = Column(String, nullable=False)
     output = Column(String)
-    duration = Column(String, nullable=False)
+    output_size = Column(Integer, default=0)
+    output_path = Column(String, nullable=True)
+    output_truncated = Column(Boolean, default=False)
+    # sha256 of the full output; when output_truncated the full text is in
+    # command_output under this hash
+    output_hash = Column(String(64), nullable=True, index=True)
+    duration = Column(String, nullable=False)      # formatted for the UI, e.g. "1.23s"
+    duration_ms = Column(Float, nullable=True)
+    connect_ms = Column(Float, nullable=True)      # SSH pool checkout, including any handshake
+    exec_ms = Column(Float, nullable=True)         # channel open until the command finished
     error = Column(String)
     asset_id = Column(Integer, ForeignKey("assets.asset_id"))
     created_at   = Column(DateTime, default=datetime.utcnow)
+    # set for commands run through the job queue
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    timeout = Column(Float, nullable=True)
+    # set for runs started by a scheduled command
+    schedule_id = Column(Integer, ForeignKey("scheduled_commands.schedule_id", ondelete="SET NULL"), nullable=True, index=True)
     
     # foreign key to user table
     owner_id = Column(Integer, ForeignKey("users.user_id"))
@@ -76,6 +114,126 @@ class CommandRequest(Base):
     owners_r = relationship("User", back_populates="commands_r")
     assets_r = relationship("Asset",  back_populates="commands_r")
 
+    # keyset pagination of the history walks (created_at, command_id) backwards
+    __table_args__ = (
+        Index("ix_command_request_owner_created", "owner_id", created_at.desc(), command_id.desc()),
+        Index("ix_command_request_asset_created", "asset_id", created_at.desc(), command_id.desc()),
+        Index("ix_command_request_status_created", "status", "created_at"),
+        Index("ix_command_request_search_tsv", command_search_vector(command_search_text(command, output, error)),
+              postgresql_using="gin").ddl_if(dialect="postgresql"),
+        Index("ix_command_request_search_trgm", command_search_text(command, output, error).label("search_text"),
+              postgresql_using="gin", postgresql_ops={"search_text": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+    )
+
+COMMAND_SEARCH_TEXT = command_search_text(CommandRequest.command, CommandRequest.output, CommandRequest.error)
+COMMAND_SEARCH_VECTOR = command_search_vector(COMMAND_SEARCH_TEXT)
+
+COMMAND_SEARCH_SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS command_request_fts USING fts5("
+    "command, output, error, content='command_request', content_rowid='command_id')",
+    "CREATE TRIGGER IF NOT EXISTS command_request_fts_ai AFTER INSERT ON command_request BEGIN "
+    "INSERT INTO command_request_fts(rowid, command, output, error) VALUES (new.command_id, new.command, new.output, new.error); END",
+    "CREATE TRIGGER IF NOT EXISTS command_request_fts_ad AFTER DELETE ON command_request BEGIN "
+    "INSERT INTO command_request_fts(command_request_fts, rowid, command, output, error) "
+    "VALUES ('delete', old.command_id, old.command, old.output, old.error); END",
+    "CREATE TRIGGER IF NOT EXISTS command_request_fts_au AFTER UPDATE OF command, output, error ON command_request BEGIN "
+    "INSERT INTO command_request_fts(command_request_fts, rowid, command, output, error) "
+    "VALUES ('delete', old.command_id, old.command, old.output, old.error); "
+    "INSERT INTO command_request_fts(rowid, command, output, error) VALUES (new.command_id, new.command, new.output, new.error); END",
+)
+
+event.listen(CommandRequest.__table__, "before_create",
+             DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"))
+for statement in COMMAND_SEARCH_SQLITE_DDL:
+    event.listen(CommandRequest.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(CommandRequest.__table__, "after_drop",
+             DDL("DROP TABLE IF EXISTS command_request_fts").execute_if(dialect="sqlite"))
+
+class CommandOutput(Base):
+    # One row per distinct output longer than the preview kept on command_request
+    __tablename__ = "command_output"
+    output_hash = Column(String(64), primary_key=True)
+    output_size = Column(Integer, nullable=False)
+    output = Column(String, nullable=True)          # full text; NULL when spooled
+    output_path = Column(String, nullable=True)     # <hash>.gz blob under OUTPUT_SPOOL_DIR
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # searched together with command_request, see search.py
+    __table_args__ = (
+        Index("ix_command_output_search_tsv", command_search_vector(func.coalesce(output, literal_column("''"))),
+              postgresql_using="gin").ddl_if(dialect="postgresql"),
+        Index("ix_command_output_search_trgm", output,
+              postgresql_using="gin", postgresql_ops={"output": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+    )
+
+OUTPUT_SEARCH_VECTOR = command_search_vector(func.coalesce(CommandOutput.output, literal_column("''")))
+
+# SQLite keeps its own copy of the text in a plain FTS5 table: command_output
+# has no integer key that an external-content table could rely on
+OUTPUT_SEARCH_SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS command_output_fts USING fts5(output_hash UNINDEXED, output)",
+    "CREATE TRIGGER IF NOT EXISTS command_output_fts_ai AFTER INSERT ON command_output WHEN new.output IS NOT NULL BEGIN "
+    "INSERT INTO command_output_fts(output_hash, output) VALUES (new.output_hash, new.output); END",
+    "CREATE TRIGGER IF NOT EXISTS command_output_fts_ad AFTER DELETE ON command_output BEGIN "
+    "DELETE FROM command_output_fts WHERE output_hash = old.output_hash; END",
+    "CREATE TRIGGER IF NOT EXISTS command_output_fts_au AFTER UPDATE OF output ON command_output BEGIN "
+    "DELETE FROM command_output_fts WHERE output_hash = old.output_hash; "
+    "INSERT INTO command_output_fts(output_hash, output) SELECT new.output_hash, new.output WHERE new.output IS NOT NULL; END",
+)
+
+event.listen(CommandOutput.__table__, "before_create",
+             DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"))
+for statement in OUTPUT_SEARCH_SQLITE_DDL:
+    event.listen(CommandOutput.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(CommandOutput.__table__, "after_drop",
+             DDL("DROP TABLE IF EXISTS command_output_fts").execute_if(dialect="sqlite"))
+
+class ExecutionRollup(Base):
+    # Finished executions counted per owner, scope (asset, group or command),
+    # hour and latency bucket. Maintained by history.py as each row is written.
+    __tablename__ = "execution_rollup"
+    rollup_id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
+    scope = Column(String, nullable=False)
+    scope_key = Column(String, nullable=False)
+    period_start = Column(DateTime, nullable=False)
+    bucket = Column(Integer, nullable=False)      # index into history.LATENCY_BUCKETS_MS
+    count = Column(Integer, nullable=False, default=0)
+    success = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    timeout = Column(Integer, nullable=False, default=0)
+    duration_ms_sum = Column(Float, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("owner_id", "scope", "scope_key", "period_start", "bucket", name="uq_execution_rollup_key"),
+        Index("ix_execution_rollup_owner_scope_period", "owner_id", "scope", "period_start"),
+    )
+
+class ScheduledCommand(Base):
+    __tablename__ = "scheduled_commands"
+    schedule_id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    command = Column(String, nullable=False)
+    cron = Column(String, nullable=False)          # 5-field cron expression, UTC
+    timeout = Column(Float, nullable=True)
+    # "skip" drops runs missed while the scheduler was down, "run_once" runs one of them late
+    misfire_policy = Column(String, nullable=False, default="run_once")
+    # "skip" does not start a run on a host where the previous one is still going, "allow" does
+    overlap_policy = Column(String, nullable=False, default="skip")
+    is_active = Column(Boolean, default=True)
+    next_run_at = Column(DateTime, nullable=True)
+    last_run_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # a schedule targets one asset or every active asset of a group
+    asset_id = Column(Integer, ForeignKey("assets.asset_id"), nullable=True)
+    group_id = Column(Integer, ForeignKey("groups.group_id"), nullable=True)
+    owner_id = Column(Integer, ForeignKey("users.user_id"))
+
+    __table_args__ = (
+        Index("ix_scheduled_commands_due", "is_active", "next_run_at"),
+    )
+
 class Blog(Base):
     __tablename__ = "blogs"
     blog_id = Column(Integer,primary_key=True , index= True)
@@ -83,6 +241,7 @@ class Blog(Base):
     asset_post_type = Column(Boolean, default=False)
     blog_content = Column(String, nullable=False)
     blog_created_at = Column(DateTime, default=datetime.utcnow)
+    blog_updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     blog_is_active = Column(Boolean ,default=True)
 
     #foreign key to the asset table
@@ -93,6 +252,12 @@ class Blog(Base):
     assets_r = relationship("Asset", back_populates="blogs_r")
     owners_r = relationship("User", back_populates="blogs_r")
 
+    # list pages per owner and per asset, newest first
+    __table_args__ = (
+        Index("ix_blogs_owner_created", "owner_id", blog_created_at.desc(), blog_id.desc()),
+        Index("ix_blogs_asset_created", "asset_id", blog_created_at.desc(), blog_id.desc()),
+    )
+
 class Scripts(Base):
     __tablename__ = "scripts"
     script_uuid = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -0,0 +1,204 @@
+import asyncio
+import gzip
+import hashlib
+import io
+import os
+import shutil
+import uuid
+from itertools import islice
+
+import anyio
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Output is content-addressed by the sha256 of its text (command_request.
+# output_hash), so identical outputs are stored once. Up to
+# OUTPUT_PREVIEW_BYTES it is simply kept in command_request.output, where a
+# hash reference would save nothing. Longer output gets one command_output row
+# per hash, holding the full text (searchable, see search.py) up to
+# OUTPUT_INLINE_LIMIT bytes and a <hash>.gz blob under OUTPUT_SPOOL_DIR beyond
+# that; the request row keeps only its first OUTPUT_PREVIEW_BYTES as a preview.
+OUTPUT_INLINE_LIMIT = int(os.getenv("OUTPUT_INLINE_LIMIT", str(64 * 1024)))
+OUTPUT_PREVIEW_BYTES = int(os.getenv("OUTPUT_PREVIEW_BYTES", "256"))
+OUTPUT_SPOOL_DIR = os.getenv("OUTPUT_SPOOL_DIR", "output_spool")
+OUTPUT_MAX_RANGE = int(os.getenv("OUTPUT_MAX_RANGE", str(1024 * 1024)))
+# bytes of streamed output gathered on the event loop before they are handed
+# to a worker thread for compression and file I/O
+OUTPUT_FLUSH_BYTES = int(os.getenv("OUTPUT_FLUSH_BYTES", str(64 * 1024)))
+
+
+def _blob_path(name):
+    return os.path.join(OUTPUT_SPOOL_DIR, name[:2], name)
+
+
+def output_preview(text):
+    # the first OUTPUT_PREVIEW_BYTES, never splitting a character
+    return text.encode()[:OUTPUT_PREVIEW_BYTES].decode(errors="ignore")
+
+
+class OutputSpool:
+    # Collects output in memory until it passes the inline limit, then streams
+    # the rest straight into a compressed blob instead of growing a string.
+    def __init__(self, inline_limit=OUTPUT_INLINE_LIMIT):
+        self.inline_limit = inline_limit
+        self.size = 0
+        self._buffer = io.StringIO()
+        self._preview = None
+        self._blob = None
+        self._name = None
+        self._digest = hashlib.sha256()
+
+    def write(self, text):
+        if not text:
+            return
+        self.size += len(text.encode())
+        if self._blob is None:
+            self._buffer.write(text)
+            if self.size <= self.inline_limit:
+                return
+            self._spill()
+        else:
+            self._blob.write(text)
+            self._digest.update(text.encode())
+
+    def _spill(self):
+        # written under a temporary name and renamed to its hash on close
+        self._name = f"{uuid.uuid4().hex}.part"
+        path = _blob_path(self._name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        buffered = self._buffer.getvalue()
+        self._preview = output_preview(buffered)
+        self._blob = gzip.open(path, "wt", encoding="utf-8", newline="")
+        self._blob.write(buffered)
+        self._digest.update(buffered.encode())
+        self._buffer = None
+
+    def close(self):
+        # Returns the CommandRequest column values for the captured output plus
+        # "output_content", the command_output row to store (or None)
+        if self._blob is None:
+            return stored_output(self._buffer.getvalue().strip(), self.size)
+        self._blob.close()
+        self._blob = None
+        output_hash = self._digest.hexdigest()
+        name = adopt_blob(self._name, output_hash)
+        return {"output": self._preview, "output_size": self.size, "output_path": name,
+                "output_truncated": True, "output_hash": output_hash,
+                "output_content": {"output_hash": output_hash, "output_size": self.size, "output": None, "output_path": name}}
+
+    def discard(self):
+        if self._blob is not None:
+            self._blob.close()
+            self._blob = None
+            os.remove(_blob_path(self._name))
+
+
+class AsyncOutputSpool:
+    # OutputSpool for code running on the event loop: chunks are buffered and
+    # written, and the spool closed, in a worker thread. close() is shielded
+    # from cancellation since callers store its result from a finally block.
+    def __init__(self, inline_limit=OUTPUT_INLINE_LIMIT, flush_bytes=OUTPUT_FLUSH_BYTES):
+        self._spool = OutputSpool(inline_limit)
+        self.flush_bytes = flush_bytes
+        self._pending = []
+        self._pending_size = 0
+        self._writing = None
+
+    async def write(self, text):
+        if not text:
+            return
+        self._pending.append(text)
+        self._pending_size += len(text)
+        if self._pending_size >= self.flush_bytes:
+            await self._flush()
+
+    async def _flush(self):
+        text, self._pending, self._pending_size = "".join(self._pending), [], 0
+        # a cancelled caller does not stop the thread, so close() waits for it
+        self._writing = asyncio.ensure_future(asyncio.to_thread(self._spool.write, text))
+        await asyncio.shield(self._writing)
+
+    async def close(self):
+        with anyio.CancelScope(shield=True):
+            if self._writing is not None:
+                await asyncio.wait([self._writing])
+            if self._pending:
+                await self._flush()
+            return await asyncio.to_thread(self._spool.close)
+
+
+def output_digest(text):
+    return hashlib.sha256(text.encode()).hexdigest() if text else None
+
+
+def stored_output(text, size=None):
+    size = len(text.encode()) if size is None else size
+    output_hash = output_digest(text)
+    if len(text.encode()) <= OUTPUT_PREVIEW_BYTES:
+        return {"output": text, "output_size": size, "output_path": None, "output_truncated": False,
+                "output_hash": output_hash, "output_content": None}
+    return {"output": output_preview(text), "output_size": size, "output_path": None, "output_truncated": True,
+            "output_hash": output_hash,
+            "output_content": {"output_hash": output_hash, "output_size": size, "output": text, "output_path": None}}
+
+
+def adopt_blob(name, output_hash):
+    # Renames a finished blob to <hash>.gz, or drops it when that content is
+    # already stored; returns the name to reference
+    target = f"{output_hash}.gz"
+    target_path = _blob_path(target)
+    if os.path.exists(target_path):
+        os.remove(_blob_path(name))
+    else:
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        os.replace(_blob_path(name), target_path)
+    return target
+
+
+def blob_digest(name):
+    digest = hashlib.sha256()
+    with gzip.open(_blob_path(name), "rb") as blob:
+        for chunk in iter(lambda: blob.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_blob(name, output_hash):
+    # Like adopt_blob() but keeps the original until remove_blob(), for
+    # callers that must commit the new reference first
+    target = f"{output_hash}.gz"
+    target_path = _blob_path(target)
+    if not os.path.exists(target_path):
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        try:
+            os.link(_blob_path(name), target_path)
+        except OSError:
+            shutil.copyfile(_blob_path(name), target_path)
+    return target
+
+
+def remove_blob(name):
+    try:
+        os.remove(_blob_path(name))
+    except FileNotFoundError:
+        pass
+
+
+def capture_output(text):
+    spool = OutputSpool()
+    spool.write(text)
+    return spool.close()
+
+
+def read_output_bytes(output_path, offset=0, length=OUTPUT_MAX_RANGE):
+    # gzip can only seek forward by decompressing, so reads cost O(offset) CPU
+    # but never hold more than the requested range in memory
+    with gzip.open(_blob_path(output_path), "rb") as blob:
+        blob.seek(offset)
+        return blob.read(min(length, OUTPUT_MAX_RANGE))
+
+
+def read_output_lines(output_path, start=0, count=1000):
+    with gzip.open(_blob_path(output_path), "rt", encoding="utf-8", newline="") as blob:
+        return [line.rstrip("\n") for line in islice(blob, start, start + count)]
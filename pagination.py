@@ -0,0 +1,36 @@
+import base64
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+# Keyset pagination over (created_at, id), newest first, shared by the list
+# endpoints. The cursor is an opaque token for the last row of a page and is
+# returned in X-Next-Cursor so response bodies stay plain lists.
+
+
+def encode_cursor(created_at, row_id):
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_page(query, cursor, limit, created_column, id_column):
+    # Rows after `cursor`, newest first, with one extra row to detect a next page
+    if cursor:
+        query = query.filter(tuple_(created_column, id_column) < tuple_(*decode_cursor(cursor)))
+    return query.order_by(created_column.desc(), id_column.desc()).limit(limit + 1)
+
+
+def page_headers(rows, limit, created_key, id_key):
+    # Trims the extra row fetched by keyset_page(); returns (rows, headers)
+    if len(rows) <= limit:
+        return rows, {}
+    rows = rows[:limit]
+    return rows, {"X-Next-Cursor": encode_cursor(rows[-1][created_key], rows[-1][id_key])}
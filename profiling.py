@@ -0,0 +1,183 @@
+import asyncio
+import json
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime
+from time import perf_counter
+
+# Opt-in request profiling. A request is profiled when it carries
+# X-Profile: <PROFILE_TOKEN>, or at random for PROFILE_SAMPLE_RATE of requests.
+# While it runs, a thread samples every PROFILE_INTERVAL seconds the stacks of
+# the event loop thread, of executor threads busy with a work item
+# (asyncio.to_thread) and of busy AnyIO worker threads, which run sync `def`
+# endpoints and dependencies. The samples are written to PROFILE_DIR in the
+# collapsed-stack format that flamegraph.pl, speedscope and inferno read, next
+# to a JSON file describing the request. Sampling shows wall-clock time, so other requests served by the
+# loop at the same time appear in the profile too; only one request is
+# profiled at a time to keep the overhead bounded.
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_HEADER = "x-profile"    # also unlocks /debug/v1/profiles, see routers/debug.py
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+
+_PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+# an AnyIO worker whose run loop is blocked on its queue has no call to make
+_IDLE_WORKER = re.compile(r"run \(_asyncio\.py:\d+\);get \(queue\.py:\d+\)")
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._loop_thread = threading.get_ident()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident, "")
+                if ident == self._loop_thread:
+                    root = "event-loop"
+                elif name.startswith("asyncio_"):
+                    # default executor (asyncio.to_thread)
+                    root = "executor"
+                elif name == "AnyIO worker thread":
+                    # Starlette's threadpool for sync endpoints and dependencies
+                    root = "worker-thread"
+                else:
+                    continue
+                stack = _collapse(frame)
+                # idle workers are skipped: executor threads outside a work
+                # item, AnyIO threads waiting on their queue for the next call
+                if root == "executor" and "run (thread.py:" not in stack:
+                    continue
+                if root == "worker-thread" and _IDLE_WORKER.search(stack):
+                    continue
+                self.stacks[f"{root};{stack}"] += 1
+            self.samples += 1
+
+
+def _write_profile(profile_id, stacks, meta):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.folded"), "w", encoding="utf-8") as f:
+        f.writelines(f"{stack} {count}\n" for stack, count in stacks.most_common())
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    _prune()
+
+
+def _prune():
+    metas = sorted((name for name in os.listdir(PROFILE_DIR) if name.endswith(".json")),
+                   key=lambda name: os.path.getmtime(os.path.join(PROFILE_DIR, name)))
+    for name in metas[:max(len(metas) - PROFILE_MAX_FILES, 0)]:
+        for suffix in (".json", ".folded"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, name[:-len(".json")] + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(limit=50):
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILE_DIR):
+        if name.endswith(".json"):
+            try:
+                with open(os.path.join(PROFILE_DIR, name), encoding="utf-8") as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    profiles.sort(key=lambda profile: profile["started_at"], reverse=True)
+    return profiles[:limit]
+
+
+def profile_path(profile_id):
+    # None for malformed ids, so a caller can never reach outside PROFILE_DIR
+    if not _PROFILE_ID.match(profile_id):
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.folded")
+    return path if os.path.exists(path) else None
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._busy = False
+
+    def _wanted(self, scope):
+        if PROFILE_TOKEN:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER.encode():
+                    return secrets.compare_digest(value.decode(errors="replace"), PROFILE_TOKEN)
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._busy or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+        status = [500]
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        self._busy = True
+        sampler = StackSampler()
+        started_at = datetime.utcnow()
+        start = perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            stacks = sampler.stop()
+            self._busy = False
+            route, endpoint = scope.get("route"), scope.get("endpoint")
+            meta = {
+                "profile_id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": getattr(route, "path", None),
+                "endpoint": getattr(endpoint, "__name__", None),
+                "status": status[0],
+                "duration_ms": round((perf_counter() - start) * 1000, 2),
+                "samples": sampler.samples,
+                "interval_ms": sampler.interval * 1000,
+                "started_at": started_at.isoformat(),
+            }
+            await asyncio.to_thread(_write_profile, profile_id, stacks, meta)
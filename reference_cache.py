@@ -0,0 +1,80 @@
+import hashlib
+import os
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+import orjson
+from fastapi import Response
+
+from cache import TTLCache
+
+# Technologies and groups are read on every page load but only change when a
+# row is inserted, so their encoded responses are cached in process and
+# dropped by invalidate() from the write paths. The TTL only bounds how long a
+# row added outside the API (seed scripts, another worker) can go unseen.
+REFERENCE_CACHE_TTL = float(os.getenv("REFERENCE_CACHE_TTL", "300"))
+
+# Per-user data behind a bearer token: clients may keep it but must revalidate
+CACHE_CONTROL = "private, no-cache"
+
+
+class ReferenceCache:
+    def __init__(self, ttl=REFERENCE_CACHE_TTL, maxsize=10000):
+        self._entries = TTLCache(ttl=ttl, maxsize=maxsize)
+        # bumped on every invalidation so a load that raced with a write is
+        # served once but not cached
+        self._generation = 0
+
+    def invalidate(self, key=None):
+        self._generation += 1
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key)
+
+    async def respond(self, request, key, load):
+        # load() returns (rows, last_modified); rows must be JSON serialisable
+        entry = self._entries.get(key)
+        if entry is None:
+            generation = self._generation
+            rows, last_modified = await load()
+            entry = _encode(rows, last_modified)
+            if generation == self._generation:
+                self._entries.set(key, entry)
+        return _conditional_response(request, entry)
+
+
+def _encode(rows, last_modified):
+    body = orjson.dumps(rows)
+    headers = {"ETag": f'"{hashlib.sha1(body).hexdigest()[:20]}"', "Cache-Control": CACHE_CONTROL}
+    if last_modified is not None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    return body, headers, last_modified
+
+
+def _not_modified(request, etag, last_modified):
+    # If-None-Match wins over If-Modified-Since when both are sent (RFC 9110)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _conditional_response(request, entry):
+    body, headers, last_modified = entry
+    if _not_modified(request, headers["ETag"], last_modified):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+technology_cache = ReferenceCache(maxsize=1)
+# keyed by owner_id
+group_cache = ReferenceCache()
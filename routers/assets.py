@@ -1,20 +1,35 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session , joinedload
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from models import Asset , User , Group , Technology
-from database import get_db
+from database_async import get_db, AsyncSessionLocal
+from asset_io import iter_records, format_rows, ImportFormatError
+from health import health_monitor
+from reference_cache import group_cache
 from schemas import AssetAdd , AssetResponse , AssetUpdate
 from utils import create_access_token, encrypt_data,decrypt_data,hash_password , verify_password
 from auth import get_current_user, custom_openapi
 from datetime import datetime
+from typing import Literal
+import asyncio
+import os
 import traceback
 
 router = APIRouter(prefix="/asset/v1", tags=["assets"])
 
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "500"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+IMPORT_REQUIRED_FIELDS = ("name", "ip", "technology", "username", "password", "group")
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
 @router.post("/add-asset")
-def add_asset(asset : AssetAdd ,current_user :  dict = Depends(get_current_user), db : Session = Depends(get_db)):
-    existing_asset=db.query(Asset).filter(Asset.ip==asset.ip).first()
-    existing_group=db.query(Group).filter(Group.name==asset.group).first()
-    existing_tech = db.query(Technology).filter(Technology.technology_id == asset.technology).first()
+async def add_asset(asset : AssetAdd ,current_user :  dict = Depends(get_current_user), db : AsyncSession = Depends(get_db)):
+    existing_asset=(await db.execute(select(Asset).filter(Asset.ip==asset.ip))).scalars().first()
+    existing_group=(await db.execute(select(Group).filter(Group.name==asset.group))).scalars().first()
+    existing_tech = await db.get(Technology, asset.technology)
     if existing_asset:
         raise HTTPException(status_code=400 , detail=f"Asset IP:{asset.ip} already exists")
     if not existing_group:
@@ -23,8 +38,9 @@ def add_asset(asset : AssetAdd ,current_user :  dict = Depends(get_current_user)
                           owner_id=current_user["user_id"],
                           created_at=datetime.utcnow())
         db.add(new_group)
-        db.commit()
-        db.refresh(new_group)
+        await db.commit()
+        group_cache.invalidate(current_user["user_id"])
+        await db.refresh(new_group)
         group_id=new_group.group_id
     else:
         group_id=existing_group.group_id
@@ -44,21 +60,21 @@ def add_asset(asset : AssetAdd ,current_user :  dict = Depends(get_current_user)
     is_active = True
     )
     db.add(new_asset)
-    db.commit()
-    db.refresh(new_asset)
+    await db.commit()
+    await db.refresh(new_asset)
     return new_asset
 
 @router.put("/edit-asset/{asset_id}")
-def edit_asset(
+async def edit_asset(
     asset_id: int,
     asset: AssetUpdate,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    existing_asset = db.query(Asset).filter(
+    existing_asset = (await db.execute(select(Asset).filter(
         Asset.asset_id == asset_id,
         Asset.owner_id == current_user["user_id"]
-    ).first()
+    ))).scalars().first()
 
     if not existing_asset:
         raise HTTPException(status_code=404, detail="Asset not found")
@@ -70,7 +86,7 @@ def edit_asset(
         existing_asset.name = asset.name
 
     if asset.technology is not None:
-        tech = db.query(Technology).filter(Technology.technology_id == asset.technology).first()
+        tech = await db.get(Technology, asset.technology)
         if not tech:
             raise HTTPException(status_code=400, detail=f"Technology ID {asset.technology} does not exist")
         existing_asset.technology = tech.technology_id
@@ -82,7 +98,7 @@ def edit_asset(
         existing_asset.password = encrypt_data(asset.password)
 
     if asset.group:
-        group = db.query(Group).filter(Group.name == asset.group).first()
+        group = (await db.execute(select(Group).filter(Group.name == asset.group))).scalars().first()
         if not group:
             group = Group(
                 name=asset.group,
@@ -91,18 +107,19 @@ def edit_asset(
                 created_at=datetime.utcnow()
             )
             db.add(group)
-            db.commit()
-            db.refresh(group)
+            await db.commit()
+            await db.refresh(group)
+            group_cache.invalidate(current_user["user_id"])
         existing_asset.group_id = group.group_id
 
     if asset.is_active is not None:
         existing_asset.is_active = asset.is_active
 
     try:
-        db.commit()
-        db.refresh(existing_asset)
+        await db.commit()
+        await db.refresh(existing_asset)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print("❌ Commit or Refresh Error:")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Internal server error while saving asset update")
@@ -116,32 +133,198 @@ def edit_asset(
 
 
 @router.delete("/delete-asset/{asset_id}")
-def delete_asset(asset_id: int, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    username = current_user["sub"]
-    existing_user = db.query(User).filter(User.username == username).first()
-    if not existing_user:
-        raise HTTPException(status_code=404, detail="User not found")
-    existing_asset = db.query(Asset).filter(Asset.asset_id == asset_id,Asset.owner_id == existing_user.user_id).first()
+async def delete_asset(asset_id: int, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    existing_asset = (await db.execute(select(Asset).filter(Asset.asset_id == asset_id,Asset.owner_id == current_user["user_id"]))).scalars().first()
     if not existing_asset:
         raise HTTPException(status_code=400, detail=f"Asset with ID {asset_id} doesn't exist for the user")
     existing_asset.is_active = False
     existing_asset.ip = existing_asset.ip + '_deleted'
-    db.commit()
-    db.refresh(existing_asset)
+    await db.commit()
+    await db.refresh(existing_asset)
     return {
             "success": True,
             "message": f"Asset '{existing_asset.name}' deleted successfully"
         }
 
 @router.get("/get-assets")
-def get_assets(current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    fetch_assets = (
-        db.query(Asset)
+async def get_assets(current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    fetch_assets = (await db.execute(
+        select(Asset)
         .options(joinedload(Asset.group_r))
         .filter(Asset.owner_id == current_user["user_id"], Asset.is_active == True)
-        .all()
+    )).scalars().all()
+    return [AssetResponse.from_orm(asset).model_copy(update={"health": health_monitor.get(asset.asset_id)})
+            for asset in fetch_assets]
+
+@router.get("/asset-health")
+async def get_asset_health(current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    assets = (await db.execute(
+        select(Asset.asset_id, Asset.name, Asset.ip)
+        .filter(Asset.owner_id == current_user["user_id"], Asset.is_active == True)
+    )).all()
+    return {
+        "summary": health_monitor.summary([asset.asset_id for asset in assets]),
+        "assets": [{"asset_id": asset.asset_id, "name": asset.name, "ip": asset.ip, "health": health_monitor.get(asset.asset_id)}
+                   for asset in assets],
+    }
+
+@router.post("/asset-health/{asset_id}/probe")
+async def probe_asset(asset_id: int, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    asset = await db.get(Asset, asset_id)
+    if not asset or asset.owner_id != current_user["user_id"] or not asset.is_active:
+        raise HTTPException(status_code=404, detail="Asset not found")
+    results = await health_monitor.check([(asset.asset_id, asset.ip)])
+    return {"asset_id": asset.asset_id, "ip": asset.ip, "health": results[asset.asset_id]}
+
+
+class _ImportReport:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, row_number, message):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"row": row_number, "error": message})
+
+
+def _encrypt_all(passwords):
+    return [encrypt_data(password) for password in passwords]
+
+
+async def _import_chunk(db, chunk, groups, owner_id, report):
+    # One transaction per chunk: duplicate check, missing groups, inserts
+    ips = [record["ip"] for _, record in chunk]
+    existing = set((await db.execute(select(Asset.ip).filter(Asset.ip.in_(ips)))).scalars())
+    rows = []
+    for row_number, record in chunk:
+        if record["ip"] in existing:
+            report.error(row_number, f"Asset IP:{record['ip']} already exists")
+        else:
+            rows.append((row_number, record))
+    if not rows:
+        return
+
+    missing = {record["group"]: record.get("group_color") or "#3b82f6" for _, record in rows if record["group"] not in groups}
+    if missing:
+        groups.update((await db.execute(select(Group.name, Group.group_id).filter(Group.name.in_(missing)))).all())
+        new_groups = [dict(name=name, color=color, owner_id=owner_id, created_at=datetime.utcnow())
+                      for name, color in missing.items() if name not in groups]
+        if new_groups:
+            groups.update((await db.execute(insert(Group).returning(Group.name, Group.group_id), new_groups)).all())
+
+    passwords = await asyncio.to_thread(_encrypt_all, [record["password"] for _, record in rows])
+    now = datetime.utcnow()
+    try:
+        await db.execute(insert(Asset), [
+            dict(name=record["name"], ip=record["ip"], technology=record["technology_id"], username=record["username"],
+                 password=password, group_id=groups[record["group"]], owner_id=owner_id, created_at=now, is_active=True)
+            for (_, record), password in zip(rows, passwords)
+        ])
+        await db.commit()
+    except IntegrityError:
+        # another writer took one of the IPs since the check above
+        await db.rollback()
+        for name in missing:
+            groups.pop(name, None)
+        for row_number, record in rows:
+            report.error(row_number, f"Asset IP:{record['ip']} conflicts with a concurrent write")
+        return
+    report.imported += len(rows)
+    if missing:
+        group_cache.invalidate(owner_id)
+
+
+@router.post("/import-assets")
+async def import_assets(
+    request: Request,
+    format: Literal["csv", "ndjson"] | None = None,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    # CSV (with a header row) or NDJSON with the add-asset fields; technology
+    # is an id or a name. The body is parsed as it arrives and written in
+    # chunks, so rows before a malformed stream stay imported.
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    technologies = {}
+    for technology_id, name in (await db.execute(select(Technology.technology_id, Technology.name))).all():
+        technologies[str(technology_id)] = technology_id
+        technologies[name.strip().lower()] = technology_id
+    groups = {}
+    seen_ips = set()
+    report = _ImportReport()
+    owner_id = current_user["user_id"]
+
+    chunk = []
+    try:
+        async for row_number, record, error in iter_records(request.stream(), fmt):
+            if error:
+                report.error(row_number, error)
+                continue
+            record = {key.strip().lower(): value.strip() for key, value in record.items()}
+            missing_fields = [field for field in IMPORT_REQUIRED_FIELDS if not record.get(field)]
+            if missing_fields:
+                report.error(row_number, f"Missing {', '.join(missing_fields)}")
+                continue
+            record["technology_id"] = technologies.get(record["technology"].lower())
+            if record["technology_id"] is None:
+                report.error(row_number, f"Technology:{record['technology']} doesn't exists")
+                continue
+            if record["ip"] in seen_ips:
+                report.error(row_number, f"Asset IP:{record['ip']} appears more than once")
+                continue
+            seen_ips.add(record["ip"])
+            chunk.append((row_number, record))
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                await _import_chunk(db, chunk, groups, owner_id, report)
+                chunk = []
+        if chunk:
+            await _import_chunk(db, chunk, groups, owner_id, report)
+    except ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=f"{e} (imported {report.imported} assets before it)")
+
+    return {
+        "imported": report.imported,
+        "failed": report.failed,
+        "errors": report.errors,
+        "errors_truncated": report.failed > len(report.errors),
+    }
+
+
+@router.get("/export-assets")
+async def export_assets(
+    format: Literal["csv", "ndjson"] = "csv",
+    include_inactive: bool = False,
+    current_user: dict = Depends(get_current_user),
+):
+    # Streams from a server-side cursor in batches; passwords are never exported
+    query = (
+        select(Asset.asset_id, Asset.name, Asset.ip, Technology.name.label("technology"), Asset.username,
+               Group.name.label("group"), Group.color.label("group_color"), Asset.is_active, Asset.created_at)
+        .outerjoin(Technology, Asset.technology == Technology.technology_id)
+        .outerjoin(Group, Asset.group_id == Group.group_id)
+        .filter(Asset.owner_id == current_user["user_id"])
+        .order_by(Asset.asset_id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
     )
-    return [AssetResponse.from_orm(asset) for asset in fetch_assets]
+    if not include_inactive:
+        query = query.filter(Asset.is_active == True)
+
+    # The request's session is closed before the body streams, so the
+    # generator opens its own
+    async def stream():
+        if format == "csv":
+            yield format_rows([], format, header=True)
+        async with AsyncSessionLocal() as session:
+            result = await session.stream(query)
+            async for rows in result.mappings().partitions():
+                yield format_rows(rows, format)
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(stream(), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="assets.{format}"'})
+
 # @router.put("/update-asset/{asset_id}", response_model=AssetResponse)
 # def update_asset(asset_id : int, asset_update : AssetUpdate,current_user :  dict = Depends(get_current_user), db: Session = Depends(get_db)):
 #     asset = db.query(Asset).filter(Asset.asset_id==asset_id ,Asset.owner_id==current_user["user_id"])
@@ -1,31 +1,61 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session ,joinedload
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import Asset , User , Blog
-from database import get_db
-from schemas import CreateBlog ,BlogResponse , EditBlog
+from database_async import get_db
+from schemas import CreateBlog ,BlogResponse , EditBlog , BlogSummaryResponse , BlogDetailResponse
 from utils import create_access_token, encrypt_data,decrypt_data,hash_password , verify_password
 from auth import get_current_user, custom_openapi
+from cache import SizedLRUCache
+from pagination import keyset_page, page_headers
 from Command import execute_remote_command
 from time import perf_counter
 from datetime import datetime
+import os
 
 router = APIRouter(prefix="/blog/v1", tags=["blogs"])
 
+BLOG_PAGE_SIZE = int(os.getenv("BLOG_PAGE_SIZE", "20"))
+BLOG_MAX_PAGE_SIZE = int(os.getenv("BLOG_MAX_PAGE_SIZE", "100"))
+# Decrypted post bodies, keyed by (blog_id, blog_updated_at) so an edit can
+# never serve the old text; capped by total characters held
+BLOG_CACHE_MAX_CHARS = int(os.getenv("BLOG_CACHE_MAX_CHARS", str(32 * 1024 * 1024)))
+_content_cache = SizedLRUCache(max_size=BLOG_CACHE_MAX_CHARS)
+
+BLOG_SUMMARY_COLUMNS = (
+    Blog.blog_id,
+    Blog.blog_title,
+    Blog.asset_post_type,
+    Blog.asset_id,
+    Blog.blog_created_at,
+    Blog.blog_updated_at,
+)
+
+def _decrypted_content(blog_id, updated_at, encrypted):
+    key = (blog_id, updated_at)
+    content = _content_cache.get(key)
+    if content is None:
+        content = decrypt_data(encrypted)
+        _content_cache.set(key, content)
+    return content
+
+def _forget_content(blog_id):
+    _content_cache.discard_keys(lambda key: key[0] == blog_id)
 
 @router.post("/create-blog")
-def create_blog(blog: CreateBlog , current_user : dict = Depends(get_current_user) , db: Session = Depends(get_db)):
+async def create_blog(blog: CreateBlog , current_user : dict = Depends(get_current_user) , db: AsyncSession = Depends(get_db)):
     if blog.asset_post_type:
         blog_create = Blog(blog_title=blog.blog_title,blog_content=encrypt_data(blog.blog_content),asset_id=blog.asset_id,owner_id=current_user["user_id"])
     else:
         blog_create = Blog(blog_title=blog.blog_title,blog_content=encrypt_data(blog.blog_content),owner_id=current_user["user_id"])
     db.add(blog_create)
-    db.commit()
-    db.refresh(blog_create)
+    await db.commit()
     return {"msesage":"Blog Created Successfully"}
 
 @router.delete("/delete-blog/{blog_id}")
-def delete_blog(blog_id: int , current_user: dict = Depends(get_current_user), db : Session = Depends(get_db)):
-    delete_blog= db.query(Blog).filter(Blog.blog_id==blog_id).first()
+async def delete_blog(blog_id: int , current_user: dict = Depends(get_current_user), db : AsyncSession = Depends(get_db)):
+    delete_blog= await db.get(Blog, blog_id)
     now=datetime.now()
     formatted_datetime = now.strftime("%Y_%m_%d_%H_%M_%S")
     deleted_title=str(delete_blog.blog_title)
@@ -33,13 +63,13 @@ def delete_blog(blog_id: int , current_user: dict = Depends(get_current_user), d
     delete_blog.blog_title=delete_blog.blog_title+'_deleted_'+formatted_datetime
     delete_blog.blog_is_active=False
     db.add(delete_blog)
-    db.commit()
-    db.refresh(delete_blog)
+    await db.commit()
+    _forget_content(blog_id)
     return {"message":"Deleted Succsesfully"}
 
 @router.post("/edit-blog/{blog_id}")
-def edit_blog(blog_id: int ,blog: EditBlog, current_user: dict = Depends(get_current_user), db : Session = Depends(get_db)):
-    edit_blog= db.query(Blog).filter(Blog.blog_id==blog_id , Blog.blog_id==blog_id).first()
+async def edit_blog(blog_id: int ,blog: EditBlog, current_user: dict = Depends(get_current_user), db : AsyncSession = Depends(get_db)):
+    edit_blog= await db.get(Blog, blog_id)
     if not edit_blog:
         raise HTTPException(status_code=404, detail="Blog not found")
     if blog.asset_post_type:
@@ -50,18 +80,17 @@ def edit_blog(blog_id: int ,blog: EditBlog, current_user: dict = Depends(get_cur
         edit_blog.blog_title=blog.blog_title
         edit_blog.blog_content=encrypt_data(blog.blog_content)
 
-    db.commit()
-    db.refresh(edit_blog)
+    await db.commit()
+    _forget_content(blog_id)
     return {"msesage":"Blog edited Successfully"}
 # def delete_blog(blog: DeleteBlog , current_user: dict = Depends(get_current_user), db : Session = Depends(get_db)):
 #     return {"message":"Deleted Succsesfully"}
 @router.get("/get-blogs")
-def get_blogs(current_user : dict = Depends(get_current_user),db: Session = Depends(get_db)):
-    fetch_blogs = (
-        db.query(Blog)
+async def get_blogs(current_user : dict = Depends(get_current_user),db: AsyncSession = Depends(get_db)):
+    fetch_blogs = (await db.execute(
+        select(Blog)
         .filter(Blog.owner_id == current_user["user_id"]).filter(Blog.blog_is_active==True)
-        .all()
-    )
+    )).scalars().all()
     results = []
     for exec in fetch_blogs:
 
@@ -69,8 +98,38 @@ def get_blogs(current_user : dict = Depends(get_current_user),db: Session = Depe
             BlogResponse(
                 blog_id=exec.blog_id,
                 blog_title=exec.blog_title,
-                blog_content=decrypt_data(exec.blog_content),
+                blog_content=_decrypted_content(exec.blog_id, exec.blog_updated_at, exec.blog_content),
                 blog_created_at=exec.blog_created_at
             )
         )
     return results
+
+@router.get("/blogs", response_model=list[BlogSummaryResponse])
+async def list_blogs(
+    cursor: str | None = None,
+    limit: int = Query(BLOG_PAGE_SIZE, gt=0, le=BLOG_MAX_PAGE_SIZE),
+    asset_id: int | None = None,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    # Titles and metadata only; blog_content is never loaded, so nothing is
+    # decrypted. Newest first, paged by (created_at, blog_id) like executions.
+    query = select(*BLOG_SUMMARY_COLUMNS).filter(Blog.owner_id == current_user["user_id"], Blog.blog_is_active == True)
+    if asset_id is not None:
+        query = query.filter(Blog.asset_id == asset_id)
+    rows = (await db.execute(
+        keyset_page(query, cursor, limit, Blog.blog_created_at, Blog.blog_id)
+    )).mappings().all()
+    rows, headers = page_headers(rows, limit, "blog_created_at", "blog_id")
+    return ORJSONResponse([dict(row) for row in rows], headers=headers)
+
+@router.get("/blogs/{blog_id}", response_model=BlogDetailResponse)
+async def get_blog(blog_id: int, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    blog = (await db.execute(
+        select(*BLOG_SUMMARY_COLUMNS, Blog.blog_content)
+        .filter(Blog.blog_id == blog_id, Blog.owner_id == current_user["user_id"], Blog.blog_is_active == True)
+    )).mappings().first()
+    if not blog:
+        raise HTTPException(status_code=404, detail="Blog not found")
+    content = _decrypted_content(blog["blog_id"], blog["blog_updated_at"], blog["blog_content"])
+    return ORJSONResponse({**blog, "blog_content": content})
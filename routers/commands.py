@@ -1,33 +1,64 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session ,joinedload
-from models import Asset , User , CommandRequest
-from database import get_db
-from schemas import CommandRequestPost , CommandRequestResponse ,AssetMiniResponse
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse, ORJSONResponse
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Asset , CommandRequest , CommandOutput , Group , ExecutionRollup
+from database_async import get_db
+from schemas import CommandRequestPost , CommandRequestResponse , CommandHistorySummary , CommandExecutionDetail ,AssetMiniResponse, CommandFanoutPost, CommandJobPost, CommandJobResponse
 from utils import create_access_token, encrypt_data,decrypt_data,hash_password , verify_password
-from auth import get_current_user, custom_openapi
-from Command import execute_remote_command
+from auth import get_current_user, custom_openapi, is_admin
+from Command import execute_remote_command_async, stream_remote_command, CommandTimeout
+from fair_scheduler import scheduler
+from health import health_monitor, HEALTH_INTERVAL
+from jobs import job_queue
+from fanout import stream_fanout
+from history import record_executions, save_executions, result_status, timing_values, latency_percentile
+from pagination import keyset_page, page_headers
+from search import apply_search, order_search, format_snippet
+from output_store import AsyncOutputSpool, capture_output, read_output_bytes, read_output_lines, OUTPUT_MAX_RANGE
 from time import perf_counter
+from datetime import datetime, timedelta
+from typing import Literal
+import asyncio
+import base64
+import json
+import os
 
 router = APIRouter(prefix="/command/v1", tags=["commands"])
 
+FANOUT_MAX_PARALLELISM = int(os.getenv("FANOUT_MAX_PARALLELISM", "20"))
+FANOUT_DEFAULT_TIMEOUT = float(os.getenv("FANOUT_DEFAULT_TIMEOUT", "60"))
+STREAM_TIMEOUT = float(os.getenv("STREAM_TIMEOUT", "3600"))
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "200"))
+STATS_DEFAULT_WINDOW_HOURS = int(os.getenv("STATS_DEFAULT_WINDOW_HOURS", "24"))
+
+def _fail_if_down(asset, force):
+    # Hosts the prober has seen down repeatedly are refused straight away
+    # instead of waiting out an SSH connect timeout; force=true tries anyway
+    if not force and health_monitor.is_down(asset.asset_id):
+        health = health_monitor.get(asset.asset_id)
+        raise HTTPException(
+            status_code=503,
+            detail=f"Asset IP:{asset.ip} is unreachable ({health['error']}), last checked {health['checked_at'].isoformat()}",
+            headers={"Retry-After": str(int(HEALTH_INTERVAL))},
+        )
+
 @router.post("/command-request")
-def command_request(cmd: CommandRequestPost, current_user :  dict = Depends(get_current_user), db : Session = Depends(get_db)):
-    username=current_user["sub"]
-    existing_user=db.query(User).filter(User.username==username).first()
-    existing_asset = db.query(Asset).filter(Asset.ip==cmd.ip).filter(Asset.owner_id==existing_user.user_id).first()
-    if not existing_user:
-        raise HTTPException(status_code=404)
+async def command_request(cmd: CommandRequestPost, force: bool = False, current_user :  dict = Depends(get_current_user), db : AsyncSession = Depends(get_db)):
+    existing_asset = (await db.execute(select(Asset).filter(Asset.ip==cmd.ip).filter(Asset.owner_id==current_user["user_id"]))).scalars().first()
     if not existing_asset:
         raise HTTPException(status_code=400, detail=f"Asset IP:{cmd.ip} doesnt exists")
+    _fail_if_down(existing_asset, force)
     
-    start = perf_counter()
-    response = execute_remote_command(hostname=cmd.ip,username=existing_asset.username,password=decrypt_data(existing_asset.password),command=cmd.command)
-    end = perf_counter()
-
-    duration_str = f"{(end - start):.2f}s"
-    cmd_log = CommandRequest(command=cmd.command,output=response["output"],error=response["error"],asset_id=existing_asset.asset_id,owner_id=existing_user.user_id,status="failed" if response["error"] else "success",duration=duration_str)
-    db.add(cmd_log)
-    db.commit()
+    async with scheduler.slot(current_user["user_id"], existing_asset.asset_id):
+        start = perf_counter()
+        response = await execute_remote_command_async(hostname=cmd.ip,username=existing_asset.username,password=decrypt_data(existing_asset.password),command=cmd.command)
+        end = perf_counter()
+
+    stored = await asyncio.to_thread(capture_output, response["output"])
+    await record_executions(db, [dict(command=cmd.command,error=response["error"],asset_id=existing_asset.asset_id,owner_id=current_user["user_id"],status=result_status(response),**timing_values(end - start, response),**stored)])
+    await db.commit()
     if response["error"]:
         return {
             "ip": cmd.ip,
@@ -41,45 +72,403 @@ def command_request(cmd: CommandRequestPost, current_user :  dict = Depends(get_
         "output": response["output"].splitlines()
         }
     
-@router.get("/executions", response_model=list[CommandRequestResponse])
-def get_execution_history(current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    username = current_user["sub"]
-    existing_user = db.query(User).filter(User.username == username).first()
-
-    if not existing_user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    executions = (
-        db.query(CommandRequest)
-        .options(
-            joinedload(CommandRequest.assets_r).joinedload(Asset.group_r)
-        )
-        .filter(CommandRequest.owner_id == existing_user.user_id)
-        .order_by(CommandRequest.created_at.desc())
-        .all()
+@router.get("/scheduler/stats")
+def get_scheduler_stats(current_user: dict = Depends(get_current_user)):
+    # admins see every user's queue, everyone else only their own
+    return scheduler.stats(None if is_admin(current_user) else current_user["user_id"])
+
+@router.post("/jobs", status_code=202)
+async def create_command_job(cmd: CommandJobPost, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    existing_asset = (await db.execute(
+        select(Asset).filter(Asset.ip == cmd.ip, Asset.owner_id == current_user["user_id"])
+    )).scalars().first()
+    if not existing_asset:
+        raise HTTPException(status_code=400, detail=f"Asset IP:{cmd.ip} doesnt exists")
+    job = await job_queue.enqueue(db, cmd.command, existing_asset.asset_id, current_user["user_id"], timeout=cmd.timeout)
+    return {"job_id": job.command_id, "status": job.status}
+
+async def _get_job(db, job_id, owner_id):
+    job = (await db.execute(
+        select(CommandRequest).filter(CommandRequest.command_id == job_id, CommandRequest.owner_id == owner_id)
+    )).scalars().first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/jobs/{job_id}", response_model=CommandJobResponse)
+async def get_command_job(job_id: int, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    job = await _get_job(db, job_id, current_user["user_id"])
+    output = job.output
+    if job.output_truncated and not job.output_path and job.output_hash:
+        stored = await db.get(CommandOutput, job.output_hash)
+        if stored is not None and stored.output is not None:
+            output = stored.output
+    return CommandJobResponse(
+        job_id=job.command_id,
+        command=job.command,
+        status=job.status,
+        output=output,
+        outputTruncated=job.output_path is not None,
+        error=job.error,
+        duration=job.duration,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
     )
 
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_command_job(job_id: int, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    job = await _get_job(db, job_id, current_user["user_id"])
+    if not await job_queue.cancel(db, job.command_id):
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is already {job.status}")
+    return {"job_id": job_id, "status": "cancelled"}
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/command-request-stream")
+async def command_request_stream(cmd: CommandRequestPost, force: bool = False, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    existing_asset = (await db.execute(
+        select(Asset).filter(Asset.ip == cmd.ip, Asset.owner_id == current_user["user_id"])
+    )).scalars().first()
+    if not existing_asset:
+        raise HTTPException(status_code=400, detail=f"Asset IP:{cmd.ip} doesnt exists")
+    _fail_if_down(existing_asset, force)
+
+    asset_id = existing_asset.asset_id
+    username = existing_asset.username
+    password = decrypt_data(existing_asset.password)
+    owner_id = current_user["user_id"]
+    # admission is decided before the response starts so it can still be a 429
+    scheduler.admit(owner_id)
+
+    # Server-sent events: one "stdout"/"stderr" event per chunk, then "end".
+    # The row is written once the stream finishes; when the client leaves first
+    # it is saved with status "cancelled".
+    async def stream():
+        output, error = AsyncOutputSpool(), []
+        status = "failed"
+        timings = {}
+        start = perf_counter()
+        try:
+            async with scheduler.slot(owner_id, asset_id, admit=False):
+                start = perf_counter()
+                async for name, text in stream_remote_command(hostname=cmd.ip, username=username, password=password, command=cmd.command, timeout=STREAM_TIMEOUT, timings=timings):
+                    if name == "stdout":
+                        await output.write(text)
+                    else:
+                        error.append(text)
+                    yield _sse(name, {"data": text})
+            status = "failed" if error else "success"
+        except CommandTimeout:
+            status = "timeout"
+            error.append(f"Command timed out after {STREAM_TIMEOUT}s")
+            yield _sse("stderr", {"data": error[-1]})
+        except (asyncio.CancelledError, GeneratorExit):
+            # the client went away, either mid-read or while a chunk was sent
+            status = "cancelled"
+            error.append("Stream cancelled by client")
+            raise
+        except Exception as e:
+            error.append(str(e))
+            yield _sse("stderr", {"data": str(e)})
+        finally:
+            durations = timing_values(perf_counter() - start, timings)
+            await save_executions([dict(command=cmd.command, error="".join(error).strip(), asset_id=asset_id,
+                                        owner_id=owner_id, status=status, **durations, **await output.close())])
+        yield _sse("end", {"status": status, "duration": durations["duration"]})
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Columns for the history list. view=full adds output and error; its output is
+# the full text from command_output, so it only counts as truncated when the
+# output was spooled to a blob (too large for JSON rows anyway).
+HISTORY_BASE_COLUMNS = (
+    CommandRequest.command_id,
+    CommandRequest.command,
+    CommandRequest.status,
+    CommandRequest.duration,
+    CommandRequest.duration_ms.label("durationMs"),
+    CommandRequest.created_at,
+    CommandRequest.output_size.label("outputSize"),
+    CommandRequest.output_hash.label("outputHash"),
+    Asset.name.label("asset"),
+    Asset.ip.label("assetIp"),
+    Group.name.label("group"),
+    Group.color.label("groupColor"),
+)
+HISTORY_SUMMARY_COLUMNS = HISTORY_BASE_COLUMNS + (
+    func.coalesce(CommandRequest.output_truncated, False).label("outputTruncated"),
+)
+HISTORY_FULL_COLUMNS = HISTORY_BASE_COLUMNS + (
+    func.coalesce(CommandOutput.output, CommandRequest.output).label("output"),
+    CommandRequest.output_path.is_not(None).label("outputTruncated"),
+    CommandRequest.error,
+)
+
+def _history_query(columns, owner_id, asset_id=None, group_id=None, status=None, since=None, until=None, output_hash=None,
+                   with_output=False):
+    # Inner joins drop rows without an asset/group in SQL so LIMIT stays exact;
+    # with_output joins command_output for HISTORY_FULL_COLUMNS
+    query = (
+        select(*columns)
+        .select_from(CommandRequest)
+        .join(Asset, CommandRequest.asset_id == Asset.asset_id)
+        .join(Group, Asset.group_id == Group.group_id)
+        .filter(CommandRequest.owner_id == owner_id)
+    )
+    if with_output:
+        query = query.outerjoin(CommandOutput, CommandOutput.output_hash == CommandRequest.output_hash)
+    if asset_id is not None:
+        query = query.filter(CommandRequest.asset_id == asset_id)
+    if group_id is not None:
+        query = query.filter(Asset.group_id == group_id)
+    if status:
+        query = query.filter(CommandRequest.status == status)
+    if since:
+        query = query.filter(CommandRequest.created_at >= since)
+    if until:
+        query = query.filter(CommandRequest.created_at < until)
+    if output_hash:
+        query = query.filter(CommandRequest.output_hash == output_hash)
+    return query
+
+# The history endpoints build their JSON with orjson, so the models below only
+# document the response
+HISTORY_RESPONSES = {
+    200: {
+        "model": list[CommandRequestResponse] | list[CommandHistorySummary],
+        "description": "Newest first. view=full rows carry output and error, view=summary rows leave both out. "
+                       "X-Next-Cursor, when present, is the cursor of the next page.",
+    },
+}
+
+@router.get("/executions", response_class=ORJSONResponse, responses=HISTORY_RESPONSES)
+async def get_execution_history(
+    cursor: str | None = None,
+    limit: int = Query(HISTORY_PAGE_SIZE, gt=0, le=HISTORY_MAX_PAGE_SIZE),
+    view: Literal["full", "summary"] = "full",
+    asset_id: int | None = None,
+    group_id: int | None = None,
+    status: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    output_hash: str | None = None,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    # output_hash lists the executions that produced one particular output
+    full = view == "full"
+    columns = HISTORY_FULL_COLUMNS if full else HISTORY_SUMMARY_COLUMNS
+    query = _history_query(columns, current_user["user_id"], asset_id, group_id, status, since, until, output_hash,
+                           with_output=full)
+    rows = (await db.execute(
+        keyset_page(query, cursor, limit, CommandRequest.created_at, CommandRequest.command_id)
+    )).mappings().all()
+
+    # Rows go straight to orjson; the page cursor goes in a header so the body
+    # stays a plain list
+    rows, headers = page_headers(rows, limit, "created_at", "command_id")
+    return ORJSONResponse([dict(row) for row in rows], headers=headers)
+
+
+@router.get("/executions/search")
+async def search_execution_history(
+    q: str = Query(..., min_length=1, max_length=500),
+    match: Literal["words", "substring"] = "words",
+    cursor: str | None = None,
+    limit: int = Query(HISTORY_PAGE_SIZE, gt=0, le=HISTORY_MAX_PAGE_SIZE),
+    asset_id: int | None = None,
+    group_id: int | None = None,
+    status: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    # Ranked results have no stable key to seek on, so the cursor is an offset
+    try:
+        offset = int(base64.urlsafe_b64decode(cursor.encode()).decode()) if cursor else 0
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    query = _history_query(HISTORY_SUMMARY_COLUMNS, current_user["user_id"], asset_id, group_id, status, since, until)
+    query = apply_search(query, db.bind.dialect.name, q, match)
+    if query is None:
+        return ORJSONResponse([])
+    rows = (await db.execute(order_search(query, match).offset(offset).limit(limit + 1))).mappings().all()
+
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = base64.urlsafe_b64encode(str(offset + limit).encode()).decode()
     results = []
-    for exec in executions:
-        asset = exec.assets_r
-        group = asset.group_r if asset else None
-
-        if not asset or not group:
-            continue
-
-        results.append(
-            CommandRequestResponse(
-                command_id=exec.command_id,
-                command=exec.command,
-                status=exec.status,
-                output=exec.output,
-                duration=exec.duration,
-                error=exec.error,
-                created_at=exec.created_at,
-                asset=asset.name,
-                assetIp=asset.ip,
-                group=group.name,
-                groupColor=group.color,
-            )
-        )
-    return results
+    for row in rows:
+        result = dict(row)
+        result["snippet"] = format_snippet(result["snippet"], q, match)
+        results.append(result)
+    return ORJSONResponse(results, headers=headers)
+
+
+@router.get("/stats")
+async def get_execution_stats(
+    scope: Literal["asset", "group", "command"] = "asset",
+    key: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    # Served from execution_rollup, which is kept per hour, so since/until are
+    # rounded down to the hour
+    until = until or datetime.utcnow()
+    since = since or until - timedelta(hours=STATS_DEFAULT_WINDOW_HOURS)
+    query = (
+        select(ExecutionRollup.scope_key, ExecutionRollup.bucket,
+               func.sum(ExecutionRollup.count), func.sum(ExecutionRollup.success), func.sum(ExecutionRollup.failed),
+               func.sum(ExecutionRollup.timeout), func.sum(ExecutionRollup.duration_ms_sum))
+        .filter(ExecutionRollup.owner_id == current_user["user_id"], ExecutionRollup.scope == scope,
+                ExecutionRollup.period_start >= since.replace(minute=0, second=0, microsecond=0),
+                ExecutionRollup.period_start < until)
+        .group_by(ExecutionRollup.scope_key, ExecutionRollup.bucket)
+    )
+    if key is not None:
+        query = query.filter(ExecutionRollup.scope_key == key)
+
+    stats = {}
+    for scope_key, bucket, count, success, failed, timeout, duration_ms_sum in (await db.execute(query)).all():
+        item = stats.setdefault(scope_key, {"key": scope_key, "total": 0, "success": 0, "failed": 0, "timeout": 0,
+                                            "duration_ms_sum": 0.0, "buckets": {}})
+        item["total"] += count
+        item["success"] += success
+        item["failed"] += failed
+        item["timeout"] += timeout
+        item["duration_ms_sum"] += duration_ms_sum
+        item["buckets"][bucket] = count
+
+    names = {}
+    if scope in ("asset", "group") and stats:
+        model, id_column = (Asset, Asset.asset_id) if scope == "asset" else (Group, Group.group_id)
+        ids = [int(scope_key) for scope_key in stats]
+        names = {str(row_id): name for row_id, name in (await db.execute(select(id_column, model.name).filter(id_column.in_(ids)))).all()}
+
+    results = []
+    for item in stats.values():
+        buckets = item.pop("buckets")
+        duration_ms_sum = item.pop("duration_ms_sum")
+        if names:
+            item["name"] = names.get(item["key"])
+        item["success_rate"] = round(item["success"] / item["total"], 4)
+        item["avg_ms"] = round(duration_ms_sum / item["total"], 2)
+        item["p50_ms"] = latency_percentile(buckets, 0.50)
+        item["p95_ms"] = latency_percentile(buckets, 0.95)
+        item["p99_ms"] = latency_percentile(buckets, 0.99)
+        results.append(item)
+    results.sort(key=lambda item: item["total"], reverse=True)
+    return ORJSONResponse({"scope": scope, "since": since.isoformat(), "until": until.isoformat(), "results": results})
+
+
+@router.get("/executions/{command_id}", response_class=ORJSONResponse, responses={200: {"model": CommandExecutionDetail}})
+async def get_execution(command_id: int, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    row = (await db.execute(
+        select(*HISTORY_FULL_COLUMNS, CommandRequest.connect_ms.label("connectMs"), CommandRequest.exec_ms.label("execMs"))
+        .select_from(CommandRequest)
+        .join(Asset, CommandRequest.asset_id == Asset.asset_id)
+        .join(Group, Asset.group_id == Group.group_id)
+        .outerjoin(CommandOutput, CommandOutput.output_hash == CommandRequest.output_hash)
+        .filter(CommandRequest.command_id == command_id, CommandRequest.owner_id == current_user["user_id"])
+    )).mappings().first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Execution not found")
+    identical = 0
+    if row["outputHash"]:
+        identical = (await db.execute(
+            select(func.count()).select_from(CommandRequest)
+            .filter(CommandRequest.output_hash == row["outputHash"], CommandRequest.owner_id == current_user["user_id"],
+                    CommandRequest.command_id != command_id)
+        )).scalar()
+    return ORJSONResponse({**row, "identicalOutputs": identical})
+
+
+@router.get("/executions/{command_id}/output")
+async def get_execution_output(
+    command_id: int,
+    offset: int | None = Query(None, ge=0),
+    length: int = Query(64 * 1024, gt=0, le=OUTPUT_MAX_RANGE),
+    start_line: int | None = Query(None, ge=0),
+    line_count: int = Query(1000, gt=0, le=10000),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    execution = (await db.execute(
+        select(CommandRequest).filter(CommandRequest.command_id == command_id, CommandRequest.owner_id == current_user["user_id"])
+    )).scalars().first()
+    if not execution:
+        raise HTTPException(status_code=404, detail="Execution not found")
+
+    size = execution.output_size or 0
+    text = execution.output or ""
+    if execution.output_truncated and not execution.output_path and execution.output_hash:
+        # full text kept once per hash in command_output
+        stored = await db.get(CommandOutput, execution.output_hash)
+        if stored is not None and stored.output is not None:
+            text = stored.output
+    if start_line is not None:
+        if execution.output_path:
+            lines = await asyncio.to_thread(read_output_lines, execution.output_path, start_line, line_count)
+        else:
+            lines = text.splitlines()[start_line:start_line + line_count]
+        return {"command_id": command_id, "size": size, "start_line": start_line, "lines": lines}
+
+    offset = offset or 0
+    if execution.output_path:
+        data = await asyncio.to_thread(read_output_bytes, execution.output_path, offset, length)
+    else:
+        data = text.encode()[offset:offset + length]
+    return {
+        "command_id": command_id,
+        "size": size,
+        "offset": offset,
+        "length": len(data),
+        "data": data.decode(errors="replace"),
+    }
+
+
+@router.post("/command-request-fanout")
+async def command_request_fanout(cmd: CommandFanoutPost, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    if cmd.group_id is None and not cmd.asset_ids:
+        raise HTTPException(status_code=400, detail="Either group_id or asset_ids is required")
+
+    query = select(Asset).filter(Asset.owner_id == current_user["user_id"], Asset.is_active == True)
+    if cmd.group_id is not None:
+        query = query.filter(Asset.group_id == cmd.group_id)
+    if cmd.asset_ids:
+        query = query.filter(Asset.asset_id.in_(cmd.asset_ids))
+    targets = [
+        (asset.asset_id, asset.ip, asset.username, decrypt_data(asset.password))
+        for asset in (await db.execute(query)).scalars().all()
+    ]
+    if not targets:
+        raise HTTPException(status_code=400, detail="No matching assets found")
+
+    parallelism = min(cmd.parallelism or FANOUT_MAX_PARALLELISM, FANOUT_MAX_PARALLELISM, len(targets))
+    timeout = cmd.timeout or FANOUT_DEFAULT_TIMEOUT
+    owner_id = current_user["user_id"]
+    limit = asyncio.Semaphore(parallelism)
+    # the semaphore is taken before the scheduler slot, so at most
+    # `parallelism` of these hosts ever wait in the scheduler queue
+    scheduler.admit(owner_id, parallelism)
+
+    async def run_one(target):
+        asset_id, ip, username, password = target
+        async with limit, scheduler.slot(owner_id, asset_id, admit=False):
+            start = perf_counter()
+            response = await execute_remote_command_async(hostname=ip, username=username, password=password, command=cmd.command, timeout=timeout)
+            return asset_id, ip, response, perf_counter() - start
+
+    def describe(response):
+        return {"command": cmd.command}
+
+    # NDJSON, one line per host in completion order
+    return StreamingResponse(stream_fanout(targets, run_one, owner_id, describe, command=cmd.command),
+                             media_type="application/x-ndjson")
@@ -0,0 +1,50 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse
+from auth import require_admin
+import db_metrics
+import profiling
+
+router = APIRouter(prefix="/debug/v1", tags=["debug"])
+
+# Profiles show every user's requests: open to admins and to whoever holds the
+# PROFILE_TOKEN that triggers profiling
+require_profiler = require_admin(profiling.PROFILE_HEADER, profiling.PROFILE_TOKEN)
+
+@router.get("/db-stats")
+def get_db_stats(current_user: dict = Depends(require_admin())):
+    # recent and slow SQL of every user's requests, so operators only
+    recent = list(db_metrics.recent_requests)
+    by_route = {}
+    for item in recent:
+        route = by_route.setdefault(item["route"], {"requests": 0, "queries": 0, "db_ms": 0.0, "n_plus_one": 0})
+        route["requests"] += 1
+        route["queries"] += item["queries"]
+        route["db_ms"] += item["db_ms"]
+        route["n_plus_one"] += bool(item["n_plus_one"])
+    for route in by_route.values():
+        route["avg_queries"] = round(route["queries"] / route["requests"], 2)
+        route["avg_db_ms"] = round(route["db_ms"] / route["requests"], 2)
+        route["db_ms"] = round(route["db_ms"], 2)
+    return {
+        "slow_query_ms": db_metrics.SLOW_QUERY_MS,
+        "routes": by_route,
+        "slow_queries": list(db_metrics.slow_queries),
+        "recent": recent[-50:],
+    }
+
+@router.get("/profiles")
+def get_profiles(limit: int = Query(50, gt=0, le=500), current_user: dict = Depends(require_profiler)):
+    return {
+        "sample_rate": profiling.PROFILE_SAMPLE_RATE,
+        "token_enabled": bool(profiling.PROFILE_TOKEN),
+        "profiles": profiling.list_profiles(limit),
+    }
+
+@router.get("/profiles/{profile_id}")
+def download_profile(profile_id: str, current_user: dict = Depends(require_profiler)):
+    # Collapsed stacks ("frame;frame;frame count" per line) for flamegraph.pl,
+    # speedscope or inferno
+    path = profiling.profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain; charset=utf-8", filename=f"{profile_id}.folded")
@@ -1,16 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import User , Group
-from database import get_db
+from database_async import get_db
 from utils import create_access_token, encrypt_data,decrypt_data,hash_password , verify_password
 from auth import get_current_user, custom_openapi
+from reference_cache import group_cache
 
 router = APIRouter(prefix="/group/v1", tags=["groups"])
 
 @router.get("/get-groups")
-def get_groups(db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
-    existing_user = db.query(User).filter(User.user_id==current_user["user_id"])
-    if not existing_user:
-        raise HTTPException(status_code=404, detail="User not found")
-    groups = db.query(Group).filter(Group.owner_id==current_user["user_id"]).all()
-    return [{"name": group.name, "color": group.color} for group in groups]
\ No newline at end of file
+async def get_groups(request: Request, db: AsyncSession = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    async def load():
+        groups = (await db.execute(
+            select(Group.name, Group.color, Group.created_at)
+            .filter(Group.owner_id==current_user["user_id"])
+            .order_by(Group.group_id)
+        )).all()
+        rows = [{"name": group.name, "color": group.color} for group in groups]
+        return rows, max((group.created_at for group in groups if group.created_at), default=None)
+
+    return await group_cache.respond(request, current_user["user_id"], load)
@@ -0,0 +1,108 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Asset , Group , ScheduledCommand , CommandRequest
+from database_async import get_db
+from schemas import ScheduledCommandPost , ScheduledCommandUpdate , ScheduledCommandResponse
+from auth import get_current_user
+from cron import CronExpression
+from schedules import SCHEDULE_MISFIRE_POLICY, SCHEDULE_OVERLAP_POLICY
+from datetime import datetime
+
+router = APIRouter(prefix="/schedule/v1", tags=["schedules"])
+
+def _next_run(cron):
+    try:
+        return CronExpression(cron).next_after(datetime.utcnow())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _check_target(db, asset_id, group_id, user_id):
+    if (asset_id is None) == (group_id is None):
+        raise HTTPException(status_code=400, detail="Exactly one of asset_id or group_id is required")
+    if asset_id is not None:
+        asset = await db.get(Asset, asset_id)
+        if not asset or asset.owner_id != user_id:
+            raise HTTPException(status_code=400, detail=f"Asset with ID {asset_id} doesn't exist for the user")
+    else:
+        group = await db.get(Group, group_id)
+        if not group or group.owner_id != user_id:
+            raise HTTPException(status_code=400, detail=f"Group with ID {group_id} doesn't exist for the user")
+
+async def _get_schedule(db, schedule_id, user_id):
+    schedule = await db.get(ScheduledCommand, schedule_id)
+    if not schedule or schedule.owner_id != user_id:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    return schedule
+
+@router.post("/schedules", response_model=ScheduledCommandResponse)
+async def create_schedule(body: ScheduledCommandPost, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    next_run_at = _next_run(body.cron)
+    await _check_target(db, body.asset_id, body.group_id, current_user["user_id"])
+    schedule = ScheduledCommand(
+        name=body.name,
+        command=body.command,
+        cron=body.cron,
+        asset_id=body.asset_id,
+        group_id=body.group_id,
+        timeout=body.timeout,
+        misfire_policy=body.misfire_policy or SCHEDULE_MISFIRE_POLICY,
+        overlap_policy=body.overlap_policy or SCHEDULE_OVERLAP_POLICY,
+        is_active=body.is_active,
+        next_run_at=next_run_at,
+        owner_id=current_user["user_id"],
+    )
+    db.add(schedule)
+    await db.commit()
+    await db.refresh(schedule)
+    return schedule
+
+@router.get("/schedules", response_model=list[ScheduledCommandResponse])
+async def get_schedules(current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    return (await db.execute(
+        select(ScheduledCommand)
+        .filter(ScheduledCommand.owner_id == current_user["user_id"])
+        .order_by(ScheduledCommand.schedule_id)
+    )).scalars().all()
+
+@router.get("/schedules/{schedule_id}", response_model=ScheduledCommandResponse)
+async def get_schedule(schedule_id: int, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    return await _get_schedule(db, schedule_id, current_user["user_id"])
+
+@router.patch("/schedules/{schedule_id}", response_model=ScheduledCommandResponse)
+async def update_schedule(schedule_id: int, body: ScheduledCommandUpdate, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    schedule = await _get_schedule(db, schedule_id, current_user["user_id"])
+    changes = body.model_dump(exclude_unset=True)
+    if "asset_id" in changes or "group_id" in changes:
+        asset_id = changes.get("asset_id", schedule.asset_id if "group_id" not in changes else None)
+        group_id = changes.get("group_id", schedule.group_id if "asset_id" not in changes else None)
+        await _check_target(db, asset_id, group_id, current_user["user_id"])
+        changes["asset_id"], changes["group_id"] = asset_id, group_id
+    # a new cron or a re-enabled schedule starts counting from now
+    if "cron" in changes or (changes.get("is_active") and not schedule.is_active):
+        changes["next_run_at"] = _next_run(changes.get("cron", schedule.cron))
+    for key, value in changes.items():
+        setattr(schedule, key, value)
+    await db.commit()
+    await db.refresh(schedule)
+    return schedule
+
+@router.delete("/schedules/{schedule_id}")
+async def delete_schedule(schedule_id: int, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    schedule = await _get_schedule(db, schedule_id, current_user["user_id"])
+    # past runs stay in the history
+    await db.delete(schedule)
+    await db.commit()
+    return {"message": "Schedule deleted"}
+
+@router.get("/schedules/{schedule_id}/runs")
+async def get_schedule_runs(schedule_id: int, limit: int = Query(50, ge=1, le=200), current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    await _get_schedule(db, schedule_id, current_user["user_id"])
+    rows = (await db.execute(
+        select(CommandRequest.command_id, CommandRequest.asset_id, CommandRequest.status,
+               CommandRequest.duration, CommandRequest.error, CommandRequest.created_at)
+        .filter(CommandRequest.schedule_id == schedule_id)
+        .order_by(CommandRequest.created_at.desc(), CommandRequest.command_id.desc())
+        .limit(limit)
+    )).all()
+    return [row._asdict() for row in rows]
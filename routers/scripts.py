@@ -1 +1,161 @@
-GITHUB_TOKEN= os.getenv("GITHUB_TOKEN")
\ No newline at end of file
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Asset , Scripts , ScriptsCategory
+from database_async import get_db
+from schemas import ScriptCategoryPost , ScriptCategoryResponse , ScriptPost , ScriptUpdate , ScriptResponse , ScriptRunPost
+from utils import decrypt_data
+from auth import get_current_user, custom_openapi
+from Command import execute_remote_script_async, script_digest, script_remote_path
+from fair_scheduler import scheduler
+from fanout import stream_fanout
+from time import perf_counter
+from datetime import datetime
+from uuid import UUID
+import asyncio
+import os
+
+router = APIRouter(prefix="/script/v1", tags=["scripts"])
+
+SCRIPT_MAX_PARALLELISM = int(os.getenv("SCRIPT_MAX_PARALLELISM", "20"))
+SCRIPT_DEFAULT_TIMEOUT = float(os.getenv("SCRIPT_DEFAULT_TIMEOUT", "300"))
+
+def _script_response(script, with_source=False):
+    return ScriptResponse(
+        script_uuid=script.script_uuid,
+        script_name=script.script_name,
+        script_extension=script.script_extension,
+        script_category_id=script.script_category_id,
+        script_hash=script_digest(script.script_source),
+        script_source=script.script_source if with_source else None,
+        created_at=script.created_at,
+        updated_at=script.updated_at,
+    )
+
+async def _get_script(db, script_uuid, owner_id):
+    script = await db.get(Scripts, script_uuid)
+    if not script or script.owner_id != owner_id or not script.script_is_active:
+        raise HTTPException(status_code=404, detail="Script not found")
+    return script
+
+async def _check_category(db, script_category_id, owner_id):
+    category = await db.get(ScriptsCategory, script_category_id)
+    if not category or category.owner_id != owner_id or not category.script_category_is_active:
+        raise HTTPException(status_code=400, detail=f"Script category {script_category_id} doesn't exist")
+
+@router.post("/categories", response_model=ScriptCategoryResponse)
+async def create_category(category: ScriptCategoryPost, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    new_category = ScriptsCategory(script_category_name=category.script_category_name, owner_id=current_user["user_id"])
+    db.add(new_category)
+    await db.commit()
+    await db.refresh(new_category)
+    return new_category
+
+@router.get("/categories", response_model=list[ScriptCategoryResponse])
+async def list_categories(current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    return (await db.execute(
+        select(ScriptsCategory)
+        .filter(ScriptsCategory.owner_id == current_user["user_id"], ScriptsCategory.script_category_is_active == True)
+        .order_by(ScriptsCategory.script_category_name)
+    )).scalars().all()
+
+@router.post("/scripts", response_model=ScriptResponse)
+async def create_script(script: ScriptPost, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    await _check_category(db, script.script_category_id, current_user["user_id"])
+    new_script = Scripts(
+        script_name=script.script_name,
+        script_extension=script.script_extension.lstrip("."),
+        script_source=script.script_source,
+        script_category_id=script.script_category_id,
+        owner_id=current_user["user_id"],
+    )
+    db.add(new_script)
+    await db.commit()
+    await db.refresh(new_script)
+    return _script_response(new_script, with_source=True)
+
+@router.get("/scripts", response_model=list[ScriptResponse])
+async def list_scripts(script_category_id: int | None = None, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    query = select(Scripts).filter(Scripts.owner_id == current_user["user_id"], Scripts.script_is_active == True)
+    if script_category_id is not None:
+        query = query.filter(Scripts.script_category_id == script_category_id)
+    scripts = (await db.execute(query.order_by(Scripts.script_name))).scalars().all()
+    return [_script_response(script) for script in scripts]
+
+@router.get("/scripts/{script_uuid}", response_model=ScriptResponse)
+async def get_script(script_uuid: UUID, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    return _script_response(await _get_script(db, script_uuid, current_user["user_id"]), with_source=True)
+
+@router.put("/scripts/{script_uuid}", response_model=ScriptResponse)
+async def update_script(script_uuid: UUID, script: ScriptUpdate, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    existing_script = await _get_script(db, script_uuid, current_user["user_id"])
+    if script.script_category_id is not None:
+        await _check_category(db, script.script_category_id, current_user["user_id"])
+        existing_script.script_category_id = script.script_category_id
+    if script.script_name is not None:
+        existing_script.script_name = script.script_name
+    if script.script_extension is not None:
+        existing_script.script_extension = script.script_extension.lstrip(".")
+    if script.script_source is not None:
+        # a new source has a new hash, so targets get it uploaded on next run
+        existing_script.script_source = script.script_source
+    existing_script.updated_at = datetime.utcnow()
+    await db.commit()
+    return _script_response(existing_script, with_source=True)
+
+@router.delete("/scripts/{script_uuid}")
+async def delete_script(script_uuid: UUID, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    existing_script = await _get_script(db, script_uuid, current_user["user_id"])
+    existing_script.script_is_active = False
+    existing_script.updated_at = datetime.utcnow()
+    await db.commit()
+    return {"success": True, "message": f"Script '{existing_script.script_name}' deleted successfully"}
+
+@router.post("/scripts/{script_uuid}/run")
+async def run_script(script_uuid: UUID, run: ScriptRunPost, current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    # Same shape as command-request-fanout (fanout.stream_fanout). Hosts that
+    # already hold the script's hash skip the upload.
+    script = await _get_script(db, script_uuid, current_user["user_id"])
+    if run.asset_id is None and run.group_id is None and not run.asset_ids:
+        raise HTTPException(status_code=400, detail="One of asset_id, group_id or asset_ids is required")
+
+    query = select(Asset).filter(Asset.owner_id == current_user["user_id"], Asset.is_active == True)
+    if run.group_id is not None:
+        query = query.filter(Asset.group_id == run.group_id)
+    asset_ids = list(run.asset_ids or []) + ([run.asset_id] if run.asset_id is not None else [])
+    if asset_ids:
+        query = query.filter(Asset.asset_id.in_(asset_ids))
+    targets = [
+        (asset.asset_id, asset.ip, asset.username, decrypt_data(asset.password))
+        for asset in (await db.execute(query)).scalars().all()
+    ]
+    if not targets:
+        raise HTTPException(status_code=400, detail="No matching assets found")
+
+    parallelism = min(run.parallelism or SCRIPT_MAX_PARALLELISM, SCRIPT_MAX_PARALLELISM, len(targets))
+    timeout = run.timeout or SCRIPT_DEFAULT_TIMEOUT
+    owner_id = current_user["user_id"]
+    source, extension = script.script_source, script.script_extension
+    try:
+        # rows saved before extensions were validated
+        script_remote_path(script_digest(source), extension)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    limit = asyncio.Semaphore(parallelism)
+    # the semaphore is taken before the scheduler slot, so at most
+    # `parallelism` of these hosts ever wait in the scheduler queue
+    scheduler.admit(owner_id, parallelism)
+
+    async def run_one(target):
+        asset_id, ip, username, password = target
+        async with limit, scheduler.slot(owner_id, asset_id, admit=False):
+            start = perf_counter()
+            response = await execute_remote_script_async(hostname=ip, username=username, password=password,
+                                                         source=source, extension=extension, timeout=timeout)
+            return asset_id, ip, response, perf_counter() - start
+
+    def describe(response):
+        return {"script": script.script_name, "path": response["path"], "uploaded": response.get("uploaded")}
+
+    return StreamingResponse(stream_fanout(targets, run_one, owner_id, describe), media_type="application/x-ndjson")
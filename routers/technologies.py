@@ -1,16 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import Technology , User
-from database import get_db
+from database_async import get_db
 from auth import get_current_user, custom_openapi
+from reference_cache import technology_cache
 from datetime import datetime
 
 router = APIRouter(prefix="/technology/v1", tags=["technologies"])
 
 @router.get("/get-technologies")
-def get_technologies(db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
-    existing_user = db.query(User).filter(User.user_id==current_user["user_id"])
-    if not existing_user:
-        raise HTTPException(status_code=404, detail="User not found")
-    technologies = db.query(Technology).all()
-    return [{"technology_id": technology.technology_id,"name": technology.name} for technology in technologies]
\ No newline at end of file
+async def get_technologies(request: Request, db: AsyncSession = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    async def load():
+        technologies = (await db.execute(
+            select(Technology.technology_id, Technology.name, Technology.created_at).order_by(Technology.technology_id)
+        )).all()
+        rows = [{"technology_id": technology.technology_id, "name": technology.name} for technology in technologies]
+        return rows, max((technology.created_at for technology in technologies if technology.created_at), default=None)
+
+    return await technology_cache.respond(request, "all", load)
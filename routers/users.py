@@ -1,25 +1,25 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select, or_
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import User
-from database import get_db
+from database_async import get_db
 from schemas import UserCreate , UserLogin , UserUpdate , UserDelete
-from utils import create_access_token, encrypt_data,decrypt_data,hash_password , verify_password
-from auth import get_current_user, custom_openapi
+from utils import create_access_token, encrypt_data,decrypt_data,hash_password_async , verify_password_async
+from auth import get_current_user, custom_openapi, invalidate_user
 from datetime import datetime
 
 router = APIRouter(prefix="/user/v1", tags=["users"])
 
 
 @router.post("/create-user")
-def create_user(user : UserCreate , db : Session = Depends(get_db)):
-    existing_user=db.query(User).filter(User.username==user.username).first()
-    existing_email=db.query(User).filter(User.email==user.email).first()
-    if existing_user is None and existing_email is None:
-        hashed_password = hash_password(user.password)
+async def create_user(user : UserCreate , db : AsyncSession = Depends(get_db)):
+    existing_user=(await db.execute(select(User).filter(or_(User.username==user.username, User.email==user.email)))).scalars().first()
+    if existing_user is None:
+        hashed_password = await hash_password_async(user.password)
         db_user = User(username=user.username , password= hashed_password, email=user.email)
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
         token_data = {"sub":db_user.username , "user_id":db_user.user_id}
         access_token = create_access_token(token_data)
         return {"user_id":db_user.user_id,
@@ -30,12 +30,12 @@ def create_user(user : UserCreate , db : Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail=f"{user.username} already exists")
 
 @router.post("/loginuser")
-def login_user(user: UserLogin, db: Session = Depends(get_db)):
-    existing_user_user = db.query(User).filter(User.username == user.identifier).first()
-
-    existing_user_email = db.query(User).filter(User.email == user.identifier).first()
-
-    existing_user = existing_user_user or existing_user_email
+async def login_user(user: UserLogin, db: AsyncSession = Depends(get_db)):
+    # a username match wins over another account whose email is the same text
+    existing_user = (await db.execute(
+        select(User).filter(or_(User.username == user.identifier, User.email == user.identifier))
+        .order_by((User.username == user.identifier).desc()).limit(1)
+    )).scalars().first()
 
     if not existing_user:
         raise HTTPException(status_code=400, detail=f"{user.identifier} does not exist")
@@ -46,7 +46,7 @@ def login_user(user: UserLogin, db: Session = Depends(get_db)):
     if existing_user.session:
         raise HTTPException(status_code=400, detail=f"{user.identifier} already logged in")
 
-    if not verify_password(user.password, existing_user.password):
+    if not await verify_password_async(user.password, existing_user.password):
         raise HTTPException(status_code=400, detail="Incorrect password")
 
     token_data = {"sub": existing_user.username, "user_id": existing_user.user_id}
@@ -67,39 +67,35 @@ def read_users_me(current_user: dict = Depends(get_current_user)):
 
 
 @router.post("/update-user-email")
-def update_user(emailupdateuser: UserUpdate, current_user: dict = Depends(get_current_user),db: Session = Depends(get_db)):
-    user_update = db.query(User).filter(User.username == current_user["sub"]).first()
+async def update_user(emailupdateuser: UserUpdate, current_user: dict = Depends(get_current_user),db: AsyncSession = Depends(get_db)):
+    user_update = await db.get(User, current_user["user_id"])
     user_update.email=emailupdateuser.email
-    db.commit()
-    db.refresh(user_update)
+    await db.commit()
+    await db.refresh(user_update)
+    invalidate_user(user_update.user_id)
     return {"message":f"{user_update.username} password updated"}
 
 @router.post("/update-user-password")
-def update_user(emailupdateuser: UserUpdate, current_user: dict = Depends(get_current_user),db: Session = Depends(get_db)):
-    user_update = db.query(User).filter(User.username == current_user["sub"]).first()
-    print(user_update.password)
-    if not verify_password(emailupdateuser.curpassword,user_update.password):
+async def update_user(emailupdateuser: UserUpdate, current_user: dict = Depends(get_current_user),db: AsyncSession = Depends(get_db)):
+    user_update = await db.get(User, current_user["user_id"])
+    if not await verify_password_async(emailupdateuser.curpassword,user_update.password):
         raise HTTPException(status_code=403, detail="Wrong password")
-    user_update.password=hash_password(emailupdateuser.newpassword)
-    db.commit()
-    db.refresh(user_update)
+    user_update.password=await hash_password_async(emailupdateuser.newpassword)
+    await db.commit()
+    await db.refresh(user_update)
+    invalidate_user(user_update.user_id)
     return {"message":f"{user_update.username} password updated"}
 
 @router.get("/get-users")
-def get_users(current_user: dict = Depends(get_current_user),db: Session = Depends(get_db)):
-    username = current_user["sub"]
-    existing_user = db.query(User).filter(User.username==username).first()
-    if not existing_user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    fetch_users = db.query(User.username).all()
+async def get_users(current_user: dict = Depends(get_current_user),db: AsyncSession = Depends(get_db)):
+    fetch_users = (await db.execute(select(User.username))).all()
     usernames = [username for (username,) in fetch_users]
     return {"users": usernames}
 
 @router.post("/delete-user")
-def delete_user(user : UserDelete , current_user: dict = Depends(get_current_user),db: Session = Depends(get_db)):
-    existing_user = db.query(User).filter(User.username==current_user["sub"]).first()
-    if not verify_password(user.password,existing_user.password):
+async def delete_user(user : UserDelete , current_user: dict = Depends(get_current_user),db: AsyncSession = Depends(get_db)):
+    existing_user = await db.get(User, current_user["user_id"])
+    if not await verify_password_async(user.password,existing_user.password):
         raise HTTPException(status_code=403, detail="Wrong password")
     now=datetime.now()
     formatted_datetime = now.strftime("%Y_%m_%d_%H_%M_%S")
@@ -108,5 +104,6 @@ def delete_user(user : UserDelete , current_user: dict = Depends(get_current_use
     existing_user.username = existing_user.username+'_delete_'+formatted_datetime
     existing_user.is_active = False
     existing_user.username = new_username
-    db.commit()
-    return {"message":f"User deleted successfully"}
\ No newline at end of file
+    await db.commit()
+    invalidate_user(existing_user.user_id)
+    return {"message":f"User deleted successfully"}
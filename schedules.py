@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+
+from sqlalchemy import or_, select, update
+
+from Command import execute_remote_batch_async
+from database_async import AsyncSessionLocal
+from fair_scheduler import scheduler
+from history import record_executions, result_status, timing_values
+from models import Asset, ScheduledCommand
+from output_store import capture_output
+from cron import CronExpression
+from utils import decrypt_data
+
+logger = logging.getLogger("linistrate.schedules")
+
+# Scheduled commands are checked every SCHEDULE_TICK seconds. All runs that are
+# due on the same host in one tick share a single pooled SSH connection, and
+# their command_request rows are written in batches by a separate flusher.
+SCHEDULE_TICK = float(os.getenv("SCHEDULE_TICK", "5"))
+SCHEDULE_DEFAULT_TIMEOUT = float(os.getenv("SCHEDULE_DEFAULT_TIMEOUT", "300"))
+# a run more than this many seconds late counts as missed
+SCHEDULE_MISFIRE_GRACE = float(os.getenv("SCHEDULE_MISFIRE_GRACE", "60"))
+SCHEDULE_MISFIRE_POLICY = os.getenv("SCHEDULE_MISFIRE_POLICY", "run_once")
+SCHEDULE_OVERLAP_POLICY = os.getenv("SCHEDULE_OVERLAP_POLICY", "skip")
+SCHEDULE_FLUSH_INTERVAL = float(os.getenv("SCHEDULE_FLUSH_INTERVAL", "2"))
+SCHEDULE_FLUSH_SIZE = int(os.getenv("SCHEDULE_FLUSH_SIZE", "500"))
+
+MISFIRE_POLICIES = ("skip", "run_once")
+OVERLAP_POLICIES = ("skip", "allow")
+
+
+class ScheduleRunner:
+    def __init__(self, tick=SCHEDULE_TICK):
+        self.tick = tick
+        self._tasks = []
+        self._inflight = set()    # host batches started by this process
+        self._active = set()      # (schedule_id, asset_id) runs still going
+        self._pending = []        # finished runs waiting for the next insert
+        self._flush_now = asyncio.Event()
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._loop()), asyncio.create_task(self._flusher())]
+
+    async def stop(self):
+        for task in self._tasks + list(self._inflight):
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._inflight, return_exceptions=True)
+        self._tasks = []
+        await self._flush()
+
+    async def _loop(self):
+        while True:
+            try:
+                await self._run_due()
+            except Exception:
+                logger.exception("scheduled command tick failed")
+            await asyncio.sleep(self.tick)
+
+    async def _run_due(self):
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            due = (await db.execute(
+                select(ScheduledCommand)
+                .filter(ScheduledCommand.is_active == True, ScheduledCommand.next_run_at <= now)
+            )).scalars().all()
+            runs = []
+            for schedule in due:
+                scheduled_at = schedule.next_run_at
+                late = (now - scheduled_at).total_seconds() > SCHEDULE_MISFIRE_GRACE
+                fire = not (late and schedule.misfire_policy == "skip")
+                values = {"next_run_at": CronExpression(schedule.cron).next_after(now)}
+                if fire:
+                    values["last_run_at"] = now
+                # Conditional update so two processes never fire the same occurrence
+                result = await db.execute(
+                    update(ScheduledCommand)
+                    .where(ScheduledCommand.schedule_id == schedule.schedule_id,
+                           ScheduledCommand.next_run_at == scheduled_at)
+                    .values(**values)
+                )
+                if result.rowcount and fire:
+                    runs.append(schedule)
+                elif result.rowcount:
+                    logger.info("schedule %s skipped a run missed at %s", schedule.schedule_id, scheduled_at)
+            await db.commit()
+            if not runs:
+                return
+
+            asset_ids = {schedule.asset_id for schedule in runs if schedule.asset_id is not None}
+            group_ids = {schedule.group_id for schedule in runs if schedule.group_id is not None}
+            assets = (await db.execute(
+                select(Asset).filter(Asset.is_active == True,
+                                     or_(Asset.asset_id.in_(asset_ids), Asset.group_id.in_(group_ids)))
+            )).scalars().all()
+
+        # Coalesce everything due on one host into one batch
+        batches = {}
+        for schedule in runs:
+            for asset in assets:
+                if asset.owner_id != schedule.owner_id:
+                    continue
+                if asset.asset_id != schedule.asset_id and (schedule.group_id is None or asset.group_id != schedule.group_id):
+                    continue
+                if schedule.overlap_policy == "skip" and (schedule.schedule_id, asset.asset_id) in self._active:
+                    logger.info("schedule %s still running on asset %s, skipping", schedule.schedule_id, asset.asset_id)
+                    continue
+                batches.setdefault(asset.asset_id, (asset, []))[1].append(schedule)
+        for asset, schedules in batches.values():
+            task = asyncio.create_task(self._run_host(asset, schedules))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _run_host(self, asset, schedules):
+        keys = {(schedule.schedule_id, asset.asset_id) for schedule in schedules}
+        self._active.update(keys)
+        try:
+            started_at = datetime.utcnow()
+            async with scheduler.slot(asset.owner_id, asset.asset_id, admit=False):
+                results = await execute_remote_batch_async(
+                    hostname=asset.ip, username=asset.username, password=decrypt_data(asset.password),
+                    commands=[(schedule.command, schedule.timeout or SCHEDULE_DEFAULT_TIMEOUT) for schedule in schedules],
+                )
+            finished_at = datetime.utcnow()
+            for schedule, response in zip(schedules, results):
+                elapsed = ((response.get("connect_ms") or 0) + (response.get("exec_ms") or 0)) / 1000
+                stored = await asyncio.to_thread(capture_output, response["output"])
+                self._pending.append(dict(
+                    command=schedule.command, status=result_status(response), error=response["error"],
+                    **timing_values(elapsed, response), asset_id=asset.asset_id, owner_id=schedule.owner_id,
+                    schedule_id=schedule.schedule_id, started_at=started_at, finished_at=finished_at,
+                    created_at=started_at, **stored,
+                ))
+            if len(self._pending) >= SCHEDULE_FLUSH_SIZE:
+                self._flush_now.set()
+        except Exception:
+            logger.exception("scheduled batch on asset %s failed", asset.asset_id)
+        finally:
+            self._active.difference_update(keys)
+
+    async def _flusher(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), SCHEDULE_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            try:
+                await self._flush()
+            except Exception:
+                logger.exception("writing scheduled command results failed")
+
+    async def _flush(self):
+        rows, self._pending = self._pending, []
+        if not rows:
+            return
+        try:
+            async with AsyncSessionLocal() as db:
+                await record_executions(db, rows)
+                await db.commit()
+        except Exception:
+            # keep them for the next attempt
+            self._pending[:0] = rows
+            raise
+
+
+schedule_runner = ScheduleRunner()
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field ,ConfigDict
-from typing import Optional
+from typing import Optional, Literal
 from datetime import datetime
+from uuid import UUID
 
 class UserCreate(BaseModel):
     username: str
@@ -59,6 +60,7 @@ class AssetResponse(BaseModel):
     is_active: bool
     owner_id: int
     group_r: Optional[GroupResponse] = None  # Must match ORM attribute name!
+    health: Optional[dict] = None            # latest probe from health.py, None until probed
 
     class Config:
         from_attributes = True
@@ -72,6 +74,28 @@ class CommandRequestPost(BaseModel):
     command: str = None
     ip: str = None
 
+class CommandJobPost(CommandRequestPost):
+    timeout: Optional[float] = None      # seconds, defaults to JOB_DEFAULT_TIMEOUT
+
+class CommandJobResponse(BaseModel):
+    job_id: int
+    command: str
+    status: str
+    output: str | None = None
+    outputTruncated: bool = False
+    error: str | None = None
+    duration: str
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+class CommandFanoutPost(BaseModel):
+    command: str
+    group_id: Optional[int] = None
+    asset_ids: Optional[list[int]] = None
+    parallelism: Optional[int] = Field(None, gt=0)    # capped by FANOUT_MAX_PARALLELISM
+    timeout: Optional[float] = Field(None, gt=0)      # per host, seconds
+
 
 
 class AssetMiniResponse(BaseModel):
@@ -81,13 +105,16 @@ class AssetMiniResponse(BaseModel):
     class Config:
         from_attributes = True
 
-class CommandRequestResponse(BaseModel):
+class CommandHistorySummary(BaseModel):
+    # one row of /executions?view=summary
     command_id: int
     command: str
     status: str
-    output: str | None = None
+    outputSize: int | None = None
+    outputTruncated: bool = False  # full text only via /executions/{id}/output
+    outputHash: str | None = None  # equal hashes mean byte-for-byte identical output
     duration: str
-    error: str | None = None
+    durationMs: float | None = None
     created_at: datetime
     asset: str           # asset name
     assetIp: str         # asset IP
@@ -97,6 +124,16 @@ class CommandRequestResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class CommandRequestResponse(CommandHistorySummary):
+    # one row of /executions?view=full
+    output: str | None = None      # full text unless outputTruncated (spooled to a blob)
+    error: str | None = None
+
+class CommandExecutionDetail(CommandRequestResponse):
+    connectMs: float | None = None
+    execMs: float | None = None
+    identicalOutputs: int = 0      # other executions of this user with the same outputHash
+
 
 class GroupBase(BaseModel):
     name: str
@@ -126,4 +163,102 @@ class BlogResponse(BaseModel):
     blog_created_at: datetime
 
 class EditBlog(CreateBlog):
-    pass
\ No newline at end of file
+    pass
+
+class BlogSummaryResponse(BaseModel):
+    blog_id: int
+    blog_title: str
+    asset_post_type: Optional[bool] = None
+    asset_id: Optional[int] = None
+    blog_created_at: Optional[datetime] = None
+    blog_updated_at: Optional[datetime] = None
+
+class BlogDetailResponse(BlogSummaryResponse):
+    blog_content: str
+
+class ScheduledCommandPost(BaseModel):
+    name: str
+    command: str
+    cron: str                                # 5-field cron expression, UTC
+    asset_id: Optional[int] = None           # one of asset_id / group_id
+    group_id: Optional[int] = None
+    timeout: Optional[float] = None          # seconds, defaults to SCHEDULE_DEFAULT_TIMEOUT
+    misfire_policy: Optional[Literal["skip", "run_once"]] = None
+    overlap_policy: Optional[Literal["skip", "allow"]] = None
+    is_active: bool = True
+
+class ScheduledCommandUpdate(BaseModel):
+    # Only the fields sent are changed. Those typed without Optional may be
+    # left out but not sent as null (422); null asset_id/group_id switches the
+    # target and null timeout restores the default.
+    name: str = None
+    command: str = None
+    cron: str = None
+    asset_id: Optional[int] = None
+    group_id: Optional[int] = None
+    timeout: Optional[float] = None
+    misfire_policy: Literal["skip", "run_once"] = None
+    overlap_policy: Literal["skip", "allow"] = None
+    is_active: bool = None
+
+class ScheduledCommandResponse(BaseModel):
+    schedule_id: int
+    name: str
+    command: str
+    cron: str
+    asset_id: Optional[int] = None
+    group_id: Optional[int] = None
+    timeout: Optional[float] = None
+    misfire_policy: str
+    overlap_policy: str
+    is_active: bool
+    next_run_at: Optional[datetime] = None
+    last_run_at: Optional[datetime] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class ScriptCategoryPost(BaseModel):
+    script_category_name: str
+
+class ScriptCategoryResponse(BaseModel):
+    script_category_id: int
+    script_category_name: str
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+# Becomes part of the file name on targets, so letters and digits only; a
+# leading dot is tolerated and stripped
+SCRIPT_EXTENSION_PATTERN = r"^\.?[A-Za-z0-9]{1,10}$"
+
+class ScriptPost(BaseModel):
+    script_name: str
+    script_extension: str = Field(pattern=SCRIPT_EXTENSION_PATTERN)    # sh, bash, py, pl, rb or anything executable
+    script_source: str
+    script_category_id: int
+
+class ScriptUpdate(BaseModel):
+    script_name: Optional[str] = None
+    script_extension: Optional[str] = Field(None, pattern=SCRIPT_EXTENSION_PATTERN)
+    script_source: Optional[str] = None
+    script_category_id: Optional[int] = None
+
+class ScriptResponse(BaseModel):
+    script_uuid: UUID
+    script_name: str
+    script_extension: str
+    script_category_id: int
+    script_hash: str                         # sha256 of the source, also its file name on targets
+    script_source: Optional[str] = None      # detail view only
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class ScriptRunPost(BaseModel):
+    asset_id: Optional[int] = None
+    group_id: Optional[int] = None
+    asset_ids: Optional[list[int]] = None
+    parallelism: Optional[int] = Field(None, gt=0)    # capped by SCRIPT_MAX_PARALLELISM
+    timeout: Optional[float] = Field(None, gt=0)      # per host, seconds
@@ -0,0 +1,141 @@
+import html
+import os
+import re
+
+from sqlalchemy import DDL, func, literal_column, or_, select, table, text, union_all
+
+from models import (CommandOutput, CommandRequest, command_search_text, command_search_vector,
+                    COMMAND_SEARCH_SQLITE_DDL, COMMAND_SEARCH_TEXT, COMMAND_SEARCH_VECTOR,
+                    OUTPUT_SEARCH_SQLITE_DDL, OUTPUT_SEARCH_VECTOR)
+
+# Search over command history. "words" matching uses the tsvector index on
+# Postgres and FTS5 on SQLite and is ranked by relevance; "substring" matching
+# is a case-insensitive LIKE that the trigram index serves on Postgres, ordered
+# by recency. Long outputs live once per hash in command_output, which has
+# indexes of its own: a row matches when its command, error and output preview
+# match, or when its full output does. Only spooled outputs (above
+# OUTPUT_INLINE_LIMIT) are matched on their preview alone.
+SEARCH_SNIPPET_WORDS = int(os.getenv("SEARCH_SNIPPET_WORDS", "16"))
+SEARCH_SNIPPET_CHARS = int(os.getenv("SEARCH_SNIPPET_CHARS", "80"))
+
+# Highlights are marked with control characters in SQL and only turned into
+# <mark> tags after the snippet has been HTML-escaped
+_START, _STOP = "\x02", "\x03"
+
+
+def _fts5_query(q):
+    # every word must match; quoting keeps FTS5 operators in user input literal
+    return " ".join(f'"{word}"' for word in re.findall(r"\w+", q))
+
+
+def _like_pattern(q):
+    return "%" + re.sub(r"([\\%_])", r"\\\1", q) + "%"
+
+
+# command, full output and error of a history row; needs the outer join
+# added by _with_full_output()
+FULL_SEARCH_TEXT = command_search_text(CommandRequest.command,
+                                       func.coalesce(CommandOutput.output, CommandRequest.output), CommandRequest.error)
+
+
+def _with_full_output(query):
+    return query.outerjoin(CommandOutput, CommandOutput.output_hash == CommandRequest.output_hash)
+
+
+def _output_hashes(condition):
+    # not correlated with the outer join, which only feeds rank and snippet
+    return CommandRequest.output_hash.in_(select(CommandOutput.output_hash).where(condition).correlate(None))
+
+
+def apply_search(query, dialect, q, match="words"):
+    # Adds the match filter plus "rank" and "snippet" columns to a history
+    # query; returns None when the text has nothing searchable in it. Each
+    # table is filtered through its own index; rank and snippet are computed
+    # on the combined text of the matching rows only.
+    if match == "substring":
+        # the snippet is a window of text around the first hit, cut in SQL
+        pattern = _like_pattern(q)
+        locate, larger = (func.strpos, func.greatest) if dialect == "postgresql" else (func.instr, func.max)
+        first = larger(locate(func.lower(FULL_SEARCH_TEXT), q.lower()) - SEARCH_SNIPPET_CHARS, 1)
+        return (
+            _with_full_output(query)
+            .filter(or_(COMMAND_SEARCH_TEXT.ilike(pattern, escape="\\"),
+                        _output_hashes(CommandOutput.output.ilike(pattern, escape="\\"))))
+            .add_columns(func.substr(FULL_SEARCH_TEXT, first, 2 * SEARCH_SNIPPET_CHARS + len(q)).label("snippet"))
+        )
+
+    if dialect == "postgresql":
+        config = literal_column("'simple'::regconfig")
+        tsquery = func.websearch_to_tsquery(config, q)
+        options = f"StartSel={_START}, StopSel={_STOP}, MaxWords={SEARCH_SNIPPET_WORDS}, MinWords=5, MaxFragments=2"
+        return (
+            _with_full_output(query)
+            .filter(or_(COMMAND_SEARCH_VECTOR.op("@@")(tsquery), _output_hashes(OUTPUT_SEARCH_VECTOR.op("@@")(tsquery))))
+            .add_columns(func.ts_rank(command_search_vector(FULL_SEARCH_TEXT), tsquery).label("rank"),
+                         func.ts_headline(config, FULL_SEARCH_TEXT, tsquery, options).label("snippet"))
+        )
+
+    fts_query = _fts5_query(q)
+    if not fts_query:
+        return None
+    request_hits = (
+        select(literal_column("rowid").label("command_id"),
+               literal_column("-bm25(command_request_fts)").label("rank"),
+               literal_column(f"snippet(command_request_fts, -1, char(2), char(3), '…', {SEARCH_SNIPPET_WORDS})").label("snippet"))
+        .select_from(table("command_request_fts"))
+        .where(text("command_request_fts MATCH :request_query").bindparams(request_query=fts_query))
+    )
+    output_fts = table("command_output_fts", literal_column("output_hash"))
+    output_hits = (
+        select(CommandRequest.command_id,
+               literal_column("-bm25(command_output_fts)").label("rank"),
+               literal_column(f"snippet(command_output_fts, 1, char(2), char(3), '…', {SEARCH_SNIPPET_WORDS})").label("snippet"))
+        .select_from(output_fts)
+        .join(CommandRequest, CommandRequest.output_hash == literal_column("command_output_fts.output_hash"))
+        .where(text("command_output_fts MATCH :output_query").bindparams(output_query=fts_query))
+    )
+    hits = union_all(request_hits, output_hits).subquery("hits")
+    # SQLite takes the bare snippet column from the row holding max(rank)
+    fts = (
+        select(hits.c.command_id, func.max(hits.c.rank).label("rank"), hits.c.snippet)
+        .group_by(hits.c.command_id)
+        .subquery("fts")
+    )
+    return (
+        query.join(fts, fts.c.command_id == CommandRequest.command_id)
+        .add_columns(fts.c.rank, fts.c.snippet)
+    )
+
+
+def order_search(query, match="words"):
+    if match == "substring":
+        return query.order_by(CommandRequest.created_at.desc(), CommandRequest.command_id.desc())
+    return query.order_by(literal_column("rank").desc(), CommandRequest.command_id.desc())
+
+
+def format_snippet(snippet, q, match="words"):
+    if snippet is None:
+        return None
+    if match == "substring":
+        position = snippet.lower().find(q.lower())
+        if position >= 0:
+            end = position + len(q)
+            snippet = snippet[:position] + _START + snippet[position:end] + _STOP + snippet[end:]
+    return html.escape(snippet).replace(_START, "<mark>").replace(_STOP, "</mark>")
+
+
+def create_search_index(conn):
+    # For databases created before search existed; create_all adds all of this
+    # to new databases
+    if conn.dialect.name == "postgresql":
+        conn.execute(DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for index in list(CommandRequest.__table__.indexes) + list(CommandOutput.__table__.indexes):
+            if "_search_" in index.name:
+                index.create(bind=conn, checkfirst=True)
+    elif conn.dialect.name == "sqlite":
+        for statement in COMMAND_SEARCH_SQLITE_DDL + OUTPUT_SEARCH_SQLITE_DDL:
+            conn.execute(DDL(statement))
+        conn.execute(text("INSERT INTO command_request_fts(command_request_fts) VALUES ('rebuild')"))
+        conn.execute(text("DELETE FROM command_output_fts"))
+        conn.execute(text("INSERT INTO command_output_fts(output_hash, output) "
+                          "SELECT output_hash, output FROM command_output WHERE output IS NOT NULL"))
@@ -0,0 +1,77 @@
+from datetime import datetime
+
+import pytest
+
+from cron import CronExpression
+
+
+def next_run(expression, after):
+    return CronExpression(expression).next_after(after)
+
+
+def test_every_field_wildcard_fires_next_minute():
+    assert next_run("* * * * *", datetime(2024, 3, 1, 10, 7, 30)) == datetime(2024, 3, 1, 10, 8)
+
+
+def test_step_over_wildcard():
+    assert next_run("*/15 * * * *", datetime(2024, 3, 1, 10, 7)) == datetime(2024, 3, 1, 10, 15)
+    assert next_run("*/15 * * * *", datetime(2024, 3, 1, 10, 45)) == datetime(2024, 3, 1, 11, 0)
+
+
+def test_step_over_range_and_from_start_value():
+    assert CronExpression("10-30/10 * * * *").minutes == {10, 20, 30}
+    assert CronExpression("5/20 * * * *").minutes == {5, 25, 45}
+
+
+def test_lists_and_names():
+    cron = CronExpression("0 0 1 jan,Jul *")
+    assert cron.months == {1, 7}
+    assert cron.next_after(datetime(2024, 2, 10)) == datetime(2024, 7, 1)
+
+
+def test_weekday_range_skips_weekend():
+    # Friday after the last hour in range rolls over to Monday morning
+    assert next_run("0 9-17 * * mon-fri", datetime(2024, 3, 1, 17, 30)) == datetime(2024, 3, 4, 9, 0)
+
+
+def test_seven_is_sunday():
+    assert CronExpression("0 0 * * 7").weekdays == {0}
+    assert next_run("0 0 * * 7", datetime(2024, 3, 1)) == datetime(2024, 3, 3)
+
+
+def test_day_of_month_only_skips_short_months():
+    assert next_run("0 0 31 * *", datetime(2024, 4, 1)) == datetime(2024, 5, 31)
+
+
+def test_day_of_month_or_day_of_week_when_both_restricted():
+    # 13th of the month or any Friday, whichever comes first
+    cron = CronExpression("0 0 13 * fri")
+    assert cron.next_after(datetime(2024, 3, 2)) == datetime(2024, 3, 8)
+    assert cron.next_after(datetime(2024, 3, 8)) == datetime(2024, 3, 13)
+
+
+def test_day_of_week_only_when_day_of_month_is_wildcard():
+    assert next_run("0 0 * * mon", datetime(2024, 3, 1)) == datetime(2024, 3, 4)
+
+
+def test_macros():
+    assert next_run("@daily", datetime(2024, 3, 1, 12)) == datetime(2024, 3, 2)
+    assert next_run("@hourly", datetime(2024, 3, 1, 12, 30)) == datetime(2024, 3, 1, 13)
+
+
+def test_leap_day():
+    assert next_run("0 0 29 2 *", datetime(2024, 3, 1)) == datetime(2028, 2, 29)
+
+
+@pytest.mark.parametrize("expression", [
+    "* * * *",          # four fields
+    "60 * * * *",       # minute out of range
+    "* 24 * * *",
+    "*/0 * * * *",      # zero step
+    "5-1 * * * *",      # reversed range
+    "* * * foo *",      # unknown month name
+    "0 0 30 2 *",       # never fires
+])
+def test_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        CronExpression(expression)
@@ -1,9 +1,9 @@
-import bcrypt
 import os
 from cryptography.fernet import Fernet
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
+from hashing import hash_password, verify_password, hash_password_async, verify_password_async
 
 
 load_dotenv()
@@ -21,12 +21,6 @@ def encrypt_data(plain_text: str) -> str:
 def decrypt_data(encrypted_text: str) -> str:
     return fernet.decrypt(encrypted_text.encode()).decode()
 
-def hash_password(plain_password: str) -> str:
-    return bcrypt.hashpw(plain_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
-
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)